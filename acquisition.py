@@ -0,0 +1,436 @@
+import ctypes
+import multiprocessing
+import os
+import select
+import threading
+import time
+
+import serial
+
+from com_monitor import ComMonitorThread, SerialReader
+from libs.decode import encode_samples
+from libs.ingest import SampleIngestor
+from libs.ringbuffer import SharedRingBuffer
+from libs.session import SessionReader
+from libs.timebase import monotonic
+from libs.utils import RateMeter, metrics
+
+
+class AcquisitionProcess(multiprocessing.Process):
+	""" A process reading and decoding the samples of one headset,
+		the multiprocess counterpart of ComMonitorThread. The COM
+		port is opened when the process is started.
+
+		Serial reads, decoding and timestamping (a SampleIngestor
+		in 'full' mode) run outside the interpreter of the GUI, so
+		several headsets use several cores. The samples are
+		appended to 'ring', a SharedRingBuffer which the parent
+		process reads with a SharedSampleReader.
+
+		ring:
+			SharedRingBuffer receiving (timestamp, sample) pairs.
+			Timestamps are monotonic() values, comparable between
+			processes.
+
+		error_q:
+			multiprocessing.Queue for error messages, as in
+			ComMonitorThread.
+
+		port_num/port_baud/port_stopbits/port_parity/port_timeout:
+			Serial communication parameters, see ComMonitorThread.
+
+		sample_rate:
+			Sample rate the device is configured with, in Hz.
+
+		serial_factory:
+			Called with the serial parameters to open the port,
+			serial.Serial by default. Must be picklable.
+
+		read_mode/latency:
+			How the port is read, see ComMonitorThread.
+
+		stats:
+			Shared counters of the decoder and the serial reader
+			(samples, sync_losses, corrupted_frames, bytes_read,
+			wakeups, chunks), updated after every read.
+	"""
+	def __init__(	self,
+					ring, error_q,
+					port_num,
+					port_baud,
+					port_stopbits=serial.STOPBITS_ONE,
+					port_parity=serial.PARITY_NONE,
+					port_timeout=0.01,
+					sample_rate=10000.,
+					serial_factory=serial.Serial,
+					read_mode='legacy',
+					latency=0.02):
+		multiprocessing.Process.__init__(self)
+		self.daemon = True
+
+		self.serial_arg = dict(	port=port_num,
+								baudrate=port_baud,
+								stopbits=port_stopbits,
+								parity=port_parity,
+								timeout=port_timeout)
+		self.serial_factory = serial_factory
+		self.sample_rate = sample_rate
+		self.read_mode = read_mode
+		self.chunk_size = SerialReader.chunk_size_for(sample_rate, latency)
+		if read_mode=='bulk':
+			self.serial_arg['timeout'] = latency
+
+		self.ring = ring
+		self.error_q = error_q
+		self.stats = multiprocessing.RawArray(ctypes.c_longlong, 6)
+
+		self.alive = multiprocessing.Event()
+		self.alive.set()
+
+	def run(self):
+		try:
+			serial_port = self.serial_factory(**self.serial_arg)
+			time.sleep(0.2)
+			serial_port.write(('conf s:%d;c:1;\n' % self.sample_rate).encode('ascii'))
+		except serial.SerialException as e:
+			self.error_q.put(str(e))
+			return
+
+		ingestor = SampleIngestor(self.sample_rate, 'full')
+		decoder = ingestor.decoder
+		reader = SerialReader(serial_port, self.read_mode, self.chunk_size)
+		while self.alive.is_set():
+			data = reader.read()
+
+			if len(data) > 0:
+				output = ingestor.ingest([(data, monotonic())])
+				if output is not None:
+					self.ring.extend(*output)
+			self.stats[:] = [decoder.samples, decoder.sync_losses, decoder.corrupted_frames,
+				reader.bytes_read, reader.wakeups, reader.chunks]
+
+		serial_port.close()
+
+	def join(self, timeout=None):
+		self.alive.clear()
+		multiprocessing.Process.join(self, timeout)
+
+
+class SharedSampleReader(object):
+	""" Reads the samples an AcquisitionProcess appended to its
+		SharedRingBuffer since the previous read.
+
+		The samples are copied out of the shared buffer, so the
+		writer may go on meanwhile. Samples the writer overwrote
+		before they were read are counted in 'lost'.
+	"""
+	def __init__(self, ring, stats=None):
+		self.ring = ring
+		self.stats = stats
+		self.read_count = 0
+		self.lost = 0
+		self.meter = RateMeter()
+
+	def read(self):
+		""" Arrays (timestamps, samples) of the new samples """
+		stop = self.ring.count
+		times, values = self.ring.between(self.read_count, stop)
+		times, values = times.copy(), values.copy()
+
+		## drop what the writer overwrote while we were copying
+		valid = self.ring.count - self.ring.capacity - (stop - len(values))
+		if valid>0:
+			times, values = times[valid:], values[valid:]
+		self.lost += stop - self.read_count - len(values)
+		self.read_count = stop
+		self.meter.add(len(values))
+		return times, values
+
+	def status(self):
+		""" Short summary of rates and link quality """
+		text = '%.0f samples/s shared, %d lost' % (self.meter.rate, self.lost)
+		if self.stats is not None:
+			text += ', %d sync losses, %d corrupted frames' % tuple(self.stats[1:3])
+		return text
+
+
+class SerialMultiplexThread(threading.Thread):
+	""" A single thread reading any number of COM ports, an
+		alternative to one ComMonitorThread per headset.
+
+		All ports are opened non-blocking and waited on together
+		with poll (select where poll is missing), like the selector
+		event loop of asyncio: the cost of waiting does not grow
+		with the number of ports, and a wakeup reads every port
+		that has data. Each port posts (data, timestamp) chunks to
+		its own data queue, exactly as a ComMonitorThread does, so
+		ProcessingWorker consumes them unchanged.
+
+		Needs ports with a file descriptor (POSIX serial ports or
+		pseudo terminals).
+
+		data_qs:
+			One data queue per port.
+
+		error_q:
+			Queue for error messages. A port that fails to open is
+			reported there and skipped, the others are read.
+
+		latency:
+			Minimum time between two wakeups. Data arriving in the
+			meantime is collected by the kernel and read in one go,
+			which trades latency for CPU as the bulk read mode of
+			ComMonitorThread.
+
+		bytes_read/wakeups/chunks:
+			Counters over all ports. The reads of a wakeup, without
+			the wait, are timed in the 'serial.read' histogram of
+			the metrics registry.
+
+		opened:
+			Event set once every port was opened and configured or
+			its error reported.
+	"""
+	def __init__(	self,
+					data_qs, error_q,
+					ports,
+					port_baud,
+					sample_rate=10000,
+					latency=0.02,
+					serial_factory=serial.Serial,
+					max_chunk=65536):
+		threading.Thread.__init__(self)
+		self.daemon = True
+
+		self.data_qs = data_qs
+		self.error_q = error_q
+		self.ports = ports
+		self.port_baud = port_baud
+		self.sample_rate = sample_rate
+		self.latency = latency
+		self.serial_factory = serial_factory
+		self.max_chunk = max_chunk
+
+		self.bytes_read = 0
+		self.wakeups = 0
+		self.chunks = 0
+		self.opened = threading.Event()
+
+		self.alive = threading.Event()
+		self.alive.set()
+
+	def open_ports(self):
+		""" Returns a dict fd -> (serial port, data queue) of the
+			ports that could be opened
+		"""
+		opened = {}
+		for port_num, data_q in zip(self.ports, self.data_qs):
+			try:
+				serial_port = self.serial_factory(port=port_num,
+					baudrate=self.port_baud, timeout=0)
+			except serial.SerialException as e:
+				self.error_q.put(str(e))
+				continue
+			opened[serial_port.fileno()] = (serial_port, data_q)
+		if not opened:
+			return opened
+		## the Arduinos reset when their port is opened, give them
+		## time to boot before sending the configuration
+		time.sleep(0.2)
+		for fd, (serial_port, data_q) in list(opened.items()):
+			try:
+				serial_port.write(('conf s:%d;c:1;\n' % self.sample_rate).encode('ascii'))
+			except serial.SerialException as e:
+				self.error_q.put(str(e))
+				serial_port.close()
+				del opened[fd]
+		return opened
+
+	def run(self):
+		opened = self.open_ports()
+		self.opened.set()
+		if not opened:
+			return
+
+		timeout = max(self.latency, 0.01)
+		if hasattr(select, 'poll'):
+			poller = select.poll()
+			for fd in opened:
+				poller.register(fd, select.POLLIN)
+			wait = lambda: [fd for fd, event in poller.poll(timeout*1e3)]
+		else:
+			wait = lambda: select.select(list(opened), [], [], timeout)[0]
+
+		read_timer = metrics.histogram('serial.read')
+		byte_counter = metrics.counter('serial.bytes')
+		while self.alive.isSet():
+			twake = time.time()
+			ready = wait()
+			self.wakeups += 1
+			timestamp = tread = monotonic()
+			for fd in ready:
+				try:
+					data = os.read(fd, self.max_chunk)
+				except OSError:
+					continue
+				if data:
+					self.bytes_read += len(data)
+					self.chunks += 1
+					byte_counter.add(len(data))
+					opened[fd][1].put((data, timestamp))
+			if ready:
+				read_timer.record(monotonic() - tread)
+			## let data accumulate until the next wakeup is due
+			rest = self.latency - (time.time() - twake)
+			if ready and rest>0:
+				time.sleep(rest)
+
+		for serial_port, data_q in opened.values():
+			serial_port.close()
+
+	def join(self, timeout=None):
+		self.alive.clear()
+		threading.Thread.join(self, timeout)
+
+
+class ReplayThread(threading.Thread):
+	""" A thread replaying a recorded session (see libs/session.py)
+		with the interface of ComMonitorThread: it posts the
+		recorded (data, timestamp) chunks to data_q as if they came
+		from the headset. Sessions of decoded samples are encoded
+		back into serial frames.
+
+		data_q/error_q:
+			As for ComMonitorThread. A session that can not be
+			opened is reported in error_q.
+
+		path:
+			Prefix of the session files.
+
+		speed:
+			1 replays in real time, N at N times the recorded
+			speed, None as fast as possible.
+
+		loop:
+			If True, the session starts over when it is finished,
+			with timestamps continuing after the previous pass.
+
+		t_start/t_stop:
+			Time range of the session to replay.
+
+		chunks/max_delay:
+			Number of chunks posted and the largest delay of a
+			chunk behind its schedule, in seconds.
+
+		finished:
+			Event set when the session was posted entirely (and
+			not looped), or could not be opened.
+	"""
+	def __init__(	self,
+					data_q, error_q,
+					path,
+					speed=1.,
+					loop=False,
+					t_start=None,
+					t_stop=None):
+		threading.Thread.__init__(self)
+		self.daemon = True
+
+		self.data_q = data_q
+		self.error_q = error_q
+		self.path = path
+		self.speed = speed
+		self.loop = loop
+		self.t_start = t_start
+		self.t_stop = t_stop
+
+		self.chunks = 0
+		self.max_delay = 0.
+		self.finished = threading.Event()
+
+		self.alive = threading.Event()
+		self.alive.set()
+
+	def run(self):
+		try:
+			session = SessionReader(self.path)
+		except (IOError, OSError, ValueError) as e:
+			self.error_q.put(str(e))
+			self.finished.set()
+			return
+
+		offset = 0.
+		twall = time.time()
+		while self.alive.isSet():
+			tfirst = None
+			for data, timestamp in session.iter_chunks(self.t_start, self.t_stop):
+				if not self.alive.isSet():
+					break
+				if tfirst is None:
+					tfirst = timestamp
+				if self.speed:
+					delay = time.time() - (twall + (timestamp - tfirst)/self.speed)
+					if delay<0:
+						time.sleep(-delay)
+					else:
+						self.max_delay = max(self.max_delay, delay)
+				if session.kind=='samples':
+					data = encode_samples(data)
+				self.data_q.put((data, timestamp + offset))
+				self.chunks += 1
+
+			if not self.loop or tfirst is None:
+				break
+			## next pass: continue the timeline one chunk after the last
+			offset += timestamp - tfirst + session.duration/max(1, len(session))
+			twall = time.time()
+		self.finished.set()
+
+	def join(self, timeout=None):
+		self.alive.clear()
+		threading.Thread.join(self, timeout)
+
+
+def start_multiplexed(data_qs, error_q, ports, port_baud,
+		sample_rate=10000., latency=0.02):
+	""" Start reading all headsets with one SerialMultiplexThread.
+		Returns the started thread and the data sources for
+		ProcessingWorker, the data queues.
+	"""
+	monitor = SerialMultiplexThread(data_qs, error_q, ports, port_baud,
+		sample_rate=sample_rate, latency=latency)
+	monitor.start()
+	return monitor, data_qs
+
+
+def start_acquisition(mode, data_q, error_q, port_num, port_baud,
+		sample_rate=10000., capacity=100000, read_mode='legacy', latency=0.02,
+		speed=1.):
+	""" Start reading one headset, either with a ComMonitorThread
+		posting chunks to data_q (mode 'thread') or with an
+		AcquisitionProcess (mode 'process'), or start replaying the
+		session recorded at port_num (mode 'replay', at 'speed'
+		times real time, None as fast as possible). Returns the started
+		monitor and the data source for ProcessingWorker: data_q
+		or a SharedSampleReader. read_mode and latency select how
+		the port is read, see ComMonitorThread.
+
+		In 'process' mode error_q must be a multiprocessing.Queue
+		and data_q is not used.
+	"""
+	if mode=='process':
+		monitor = AcquisitionProcess(SharedRingBuffer(capacity), error_q,
+			port_num, port_baud, sample_rate=sample_rate,
+			read_mode=read_mode, latency=latency)
+		source = SharedSampleReader(monitor.ring, monitor.stats)
+	elif mode=='thread':
+		monitor = ComMonitorThread(data_q, error_q, port_num, port_baud,
+			sample_rate=sample_rate, read_mode=read_mode, latency=latency)
+		source = data_q
+	elif mode=='replay':
+		monitor = ReplayThread(data_q, error_q, port_num, speed=speed)
+		source = data_q
+	else:
+		raise ValueError('unknown acquisition mode %r' % mode)
+	monitor.start()
+	return monitor, source
@@ -0,0 +1,165 @@
+"""
+Aggregate throughput and GUI frame time with 2, 4 and 8 simulated
+headsets, acquired by ComMonitorThreads in the GUI process or by
+one AcquisitionProcess per headset writing to shared memory.
+
+Run from the repository root:
+
+	python -m benchmarks.bench_acquisition [sample_rate] [duration]
+
+Each simulated device streams encoded samples at sample_rate
+(default 10 kHz) for duration seconds (default 5). All headsets
+feed a ProcessingWorker as in the monitors; the main thread stands
+in for the GUI and prepares the curves of the worker snapshots at
+10 Hz as the monitor does, without painting them (FrameRenderer).
+Reported are the samples/s that reached the pipeline and the time
+spent per frame, which grows when the acquisition competes for the
+GIL. The process mode can only gain with more CPUs than headsets.
+"""
+from __future__ import print_function, division
+import sys, time
+import multiprocessing
+import Queue
+import numpy as np
+from scipy.signal import butter
+
+from acquisition import AcquisitionProcess, SharedSampleReader
+from com_monitor import ComMonitorThread
+from libs.decode import encode_samples
+from libs.decimate import CurveDecimator, RangeKeeper
+from libs.ringbuffer import SharedRingBuffer
+from processing import PlayersPipeline, Arena, ProcessingWorker
+
+
+class SimulatedSerial(object):
+	""" Stand-in for serial.Serial producing encoded samples of a
+		10 Hz sine wave at sample_rate, as fast as a device would.
+	"""
+	sample_rate = 10000.
+
+	def __init__(self, port=None, baudrate=None, stopbits=None, parity=None, timeout=None):
+		self.timeout = timeout or 0.
+		fs = int(self.sample_rate)
+		samples = 500 + 100*np.sin(2*np.pi*10*np.arange(fs)/fs)
+		self._frames = encode_samples(samples.astype(int))*2
+		self._start = time.time()
+		self._sent = 0
+
+	def _available(self):
+		return 2*int((time.time() - self._start)*self.sample_rate) - self._sent
+
+	def inWaiting(self):
+		return max(0, self._available())
+
+	def read(self, size=1):
+		""" waits until size bytes arrived or the timeout expired """
+		deadline = time.time() + self.timeout
+		while self._available()<size and time.time()<deadline:
+			time.sleep(0.001)
+		size = min(size, self.inWaiting(), len(self._frames)//2)
+		start = self._sent % (len(self._frames)//2)
+		self._sent += size
+		return self._frames[start:start + size]
+
+	def write(self, data):
+		pass
+
+	def close(self):
+		pass
+
+
+class NullPlot(object):
+	""" Stand-in for a pyqtgraph plot that takes the x range """
+	def setXRange(self, xmin, xmax, padding=None):
+		pass
+
+
+class FrameRenderer(object):
+	""" Work of one GUI frame up to the painting, as in
+		PlottingDataMonitor.update_monitor: the signal curves are
+		cut to the time axis and decimated to the plot width with
+		CurveDecimator and the axis moved with RangeKeeper, the
+		spectra decimated likewise.
+	"""
+	def __init__(self, nplayers, width=1000, time_axis_range=2.):
+		self.width = width
+		self.time_axis_range = time_axis_range
+		self.plot = NullPlot()
+		self.time_range = RangeKeeper()
+		self.decimators = [CurveDecimator() for i in range(nplayers)]
+		self.decimators_fft = [CurveDecimator() for i in range(nplayers)]
+
+	def __call__(self, snapshot):
+		players = snapshot['players']
+		xdata = players[0]['times']
+		visible = None
+		if len(xdata):
+			visible = (max(0, xdata[-1] - self.time_axis_range), max(self.time_axis_range, xdata[-1]))
+			self.time_range.set_range(self.plot, visible[0], visible[1], self.width)
+		for player, decimator in zip(players, self.decimators):
+			if len(player['times']):
+				decimator.update(player['times'], player['signal'], visible, self.width)
+		for player, decimator_fft in zip(players, self.decimators_fft):
+			if player['ready']:
+				freq = player['freq']
+				decimator_fft.update(freq, player['spectrum'], (freq[0], freq[-1]), self.width)
+
+
+def run(mode, ndevices, sample_rate, duration, nmax):
+	b, a = butter(3, [0.001, 0.34], btype='band')
+	monitors, sources = [], []
+	for i in range(ndevices):
+		if mode=='process':
+			monitor = AcquisitionProcess(SharedRingBuffer(10*nmax), multiprocessing.Queue(),
+				'sim%d' % i, 230400, sample_rate=sample_rate, serial_factory=SimulatedSerial)
+			source = SharedSampleReader(monitor.ring, monitor.stats)
+		else:
+			source = Queue.Queue()
+			monitor = ComMonitorThread(source, Queue.Queue(), 'sim%d' % i, 230400,
+				serial_factory=SimulatedSerial)
+		monitor.start()
+		monitors.append(monitor)
+		sources.append(source)
+
+	pipeline = PlayersPipeline(ndevices, sample_rate, 'full', sample_rate, nmax, b, a, 4, 13)
+	arena = Arena([(-1)**i for i in range(ndevices)])
+	worker = ProcessingWorker(sources, pipeline, arena)
+	worker.start()
+	render = FrameRenderer(ndevices)
+
+	time.sleep(0.5)
+	count0 = np.sum(pipeline.resampler.count)
+	frames = []
+	tstart = time.time()
+	while time.time() - tstart<duration:
+		tframe = time.time()
+		if worker.snapshots.has_new_data:
+			render(worker.snapshots.read_data())
+			frames.append(time.time() - tframe)
+		time.sleep(max(0, 0.1 - (time.time() - tframe)))
+	rate = (np.sum(pipeline.resampler.count) - count0)/(time.time() - tstart)
+
+	worker.join(1.)
+	for monitor in monitors:
+		monitor.join(1.)
+	frames = np.array(frames)*1e3
+	return rate, np.mean(frames), np.percentile(frames, 95)
+
+
+def main(argv):
+	sample_rate = float(argv[0]) if argv else 10000.
+	duration = float(argv[1]) if len(argv)>1 else 5.
+	SimulatedSerial.sample_rate = sample_rate
+	nmax = int(2*sample_rate)
+	print('%.0f Hz per device, %.0f s per run, %d CPUs' % (sample_rate, duration,
+		multiprocessing.cpu_count()))
+	print('devices  mode      samples/s  expected   frame mean  frame p95 [ms]')
+	for ndevices in (2, 4, 8):
+		for mode in ('thread', 'process'):
+			rate, mean, p95 = run(mode, ndevices, sample_rate, duration, nmax)
+			print('%7d  %-8s %10.0f %9.0f %11.2f %10.2f' % (ndevices, mode,
+				rate, ndevices*sample_rate, mean, p95))
+
+
+if __name__ == "__main__":
+	main(sys.argv[1:])
@@ -0,0 +1,102 @@
+"""
+Cost of one consumer tick of ProcessingWorker against the number of
+chunks pending: get_all_from_queue (one get_nowait and one lock per
+chunk) and joining the list, against ChunkQueue.drain() (one lock,
+then the joined data with the chunk ends and timestamps).
+
+Run from the repository root:
+
+	python -m benchmarks.bench_chunkqueue [chunk_bytes]
+
+Chunks are chunk_bytes long (default 400, 20 ms of one headset at
+10 kHz).
+
+First the accounting of discarded data is checked on a simulated
+10 kHz headset whose chunks arrive 2 ms after their last sample,
+with a consumer that stalls for 2 s while the queue holds 1 s: for
+'drop-oldest' and 'coalesce', the sample times a SampleIngestor
+gives the chunks drained after the stall, passing on the bytes
+drain() reports as discarded, must be within 3 ms of the truth
+(AssertionError otherwise). Without passing them on, the times are
+off by about the data lost.
+"""
+from __future__ import print_function, division
+import sys, time
+import Queue
+import numpy as np
+
+from libs.chunkqueue import ChunkQueue
+from libs.decode import encode_samples
+from libs.ingest import SampleIngestor
+from libs.utils import get_all_from_queue
+
+
+def per_item(q):
+	qdata = list(get_all_from_queue(q))
+	return b''.join([item[0] for item in qdata]), qdata[-1][1]
+
+
+def batched(q):
+	data, ends, timestamps, dropped = q.drain()
+	return data, timestamps[-1]
+
+
+def tick(q, take, nchunks, chunk, repeat=200):
+	""" us per tick taking nchunks pending chunks """
+	elapsed = 0.
+	for i in range(repeat):
+		for j in range(nchunks):
+			q.put((chunk, float(j)))
+		tstart = time.time()
+		data, timestamp = take(q)
+		elapsed += time.time() - tstart
+		assert len(data)==nchunks*len(chunk)
+	return elapsed/repeat*1e6
+
+
+def stall_error(policy, account, fs=10000., chunk=200, delay=0.002, stall=(2., 2.), seconds=6.):
+	""" Largest error in s of the sample times after a consumer
+		stall, simulated: a chunk of 'chunk' samples is put every
+		chunk/fs seconds and drained right away, except during the
+		stall. With 'account', the discarded bytes are passed on to
+		the ingestor.
+	"""
+	rng = np.random.RandomState(0)
+	nchunks = int(seconds*fs/chunk)
+	frames = encode_samples(rng.randint(0, 1024, nchunks*chunk))
+	q = ChunkQueue(int(fs/chunk), policy, max_bytes=int(2*fs))
+	ingestor = SampleIngestor(fs)
+	error = 0.
+	for j in range(nchunks):
+		t_last = ((j + 1)*chunk - 1)/fs
+		q.put((frames[2*j*chunk:2*(j + 1)*chunk], t_last + delay))
+		if stall[0]<=t_last + delay<stall[0] + stall[1]:
+			continue
+		data, ends, timestamps, dropped = q.drain()
+		times, samples = ingestor.ingest_data(data, timestamps[-1], dropped if account else 0)
+		if t_last>=stall[0]:
+			## the data drained is the contiguous tail up to t_last
+			truth = t_last - np.arange(len(times))[::-1]/fs
+			error = max(error, np.max(np.abs(times - truth)))
+	return error
+
+
+def main(argv):
+	for policy in ('drop-oldest', 'coalesce'):
+		error, unaccounted = stall_error(policy, True), stall_error(policy, False)
+		print('%-11s 2 s stall: times after it %6.1f ms off, %6.1f ms without the dropped bytes' % (
+			policy, error*1e3, unaccounted*1e3))
+		if error>0.003:
+			raise AssertionError('%s: times %.1f ms off after a stall' % (policy, error*1e3))
+
+	nbytes = int(argv[0]) if argv else 400
+	chunk = b'\x80\x00'*(nbytes//2)
+	print('chunk %d bytes' % nbytes)
+	print('pending  Queue+get_all_from_queue [us]  ChunkQueue.drain [us]')
+	for nchunks in (1, 4, 16, 64, 256, 1000):
+		print('%7d %33.1f %22.1f' % (nchunks, tick(Queue.Queue(), per_item, nchunks, chunk),
+			tick(ChunkQueue(), batched, nchunks, chunk)))
+
+
+if __name__ == "__main__":
+	main(sys.argv[1:])
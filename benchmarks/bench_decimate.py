@@ -0,0 +1,90 @@
+"""
+Frame time of the signal plot against the size of the signal
+window, drawing every sample against drawing the min/max envelope
+of CurveDecimator (two points per pixel).
+
+Run from the repository root:
+
+	python -m benchmarks.bench_decimate [width]
+
+Every frame scrolls a window of n samples of a noisy signal with
+sparse spikes by 10 ms at 10 kHz, as one plot tick would, in a plot
+'width' pixels wide (default 800). Reported are the points handed
+to the curve and the time to prepare them. With pyqtgraph and a
+display available, the time of setData plus the repaint is measured
+as well. The envelope is checked to keep every spike.
+"""
+from __future__ import print_function, division
+import sys, time
+import numpy as np
+
+from libs.decimate import CurveDecimator
+
+
+def make_signal(n, fs=10000.):
+	rng = np.random.RandomState(0)
+	y = 500 + 20*rng.normal(size=n)
+	y[rng.randint(0, n, max(1, n//5000))] += 300
+	return np.arange(n)/fs, y
+
+
+def frames(t, y, nwindow, nframes, step=100):
+	""" (times, signal, visible) of successive plot ticks """
+	for i in range(nframes):
+		stop = nwindow + i*step
+		yield t[stop-nwindow:stop], y[stop-nwindow:stop], (t[stop-nwindow], t[stop-1])
+
+
+def prepare(nwindow, width, nframes=50):
+	t, y = make_signal(nwindow + nframes*100)
+	decimator = CurveDecimator()
+	points = []
+	tstart = time.time()
+	for times, signal, visible in frames(t, y, nwindow, nframes):
+		data = decimator.update(times, signal, visible, width)
+		points.append(len(data[0]))
+		if data[1].max()!=signal.max() or data[1].min()!=signal.min():
+			raise AssertionError('the envelope lost a peak')
+	return np.mean(points), (time.time() - tstart)/nframes*1e3
+
+
+def draw(nwindow, width, decimate, nframes=30):
+	""" ms per frame of setData and repaint, None without Qt """
+	try:
+		import pyqtgraph as pg
+		from PyQt4.QtGui import QApplication
+	except ImportError:
+		return None
+	app = QApplication.instance() or QApplication(sys.argv)
+	plot = pg.PlotWidget()
+	plot.resize(width, 300)
+	plot.show()
+	curve = plot.plot()
+	t, y = make_signal(nwindow + nframes*100)
+	decimator = CurveDecimator()
+	tstart = time.time()
+	for times, signal, visible in frames(t, y, nwindow, nframes):
+		if decimate:
+			times, signal = decimator.update(times, signal, visible, width)
+		curve.setData(times, signal)
+		plot.setXRange(*visible)
+		app.processEvents()
+	elapsed = (time.time() - tstart)/nframes*1e3
+	plot.close()
+	return elapsed
+
+
+def main(argv):
+	width = int(argv[0]) if argv else 800
+	print('plot width %d pixels' % width)
+	print('window    points  decimated  prepare [ms]  draw all [ms]  draw decimated [ms]')
+	for nwindow in (1000, 10000, 20000, 100000, 1000000):
+		points, prep = prepare(nwindow, width)
+		full, decimated = draw(nwindow, width, False), draw(nwindow, width, True)
+		print('%7d %8d %10.0f %13.3f %14s %20s' % (nwindow, nwindow, points, prep,
+			'-' if full is None else '%.2f' % full,
+			'-' if decimated is None else '%.2f' % decimated))
+
+
+if __name__ == "__main__":
+	main(sys.argv[1:])
@@ -0,0 +1,88 @@
+"""
+Throughput of the vectorized decode_output and of the StreamDecoder
+against the per-byte reference implementation.
+
+Run from the repository root:
+
+	python -m benchmarks.bench_decode [recorded_stream.bin ...]
+
+Both decoders are first checked for identical output on synthetic
+streams (aligned, misaligned, odd length, empty) and on every
+recorded raw byte stream given on the command line.
+"""
+from __future__ import print_function, division
+import sys, time
+import numpy as np
+
+from libs.decode import decode_output, decode_output_loop, encode_samples, StreamDecoder
+
+
+def synthetic_stream(nsamples, seed=0):
+	""" 2-byte frames of a noisy 10 Hz sine sampled at 10 kHz """
+	rng = np.random.RandomState(seed)
+	t = np.arange(nsamples)/10000.
+	samples = 512 + 200*np.sin(2*np.pi*10*t) + rng.normal(scale=20, size=nsamples)
+	return encode_samples(np.clip(samples, 0, 1023))
+
+
+def check_identical(stream, name):
+	expected = np.asarray(decode_output_loop(stream), dtype=np.uint16)
+	result = decode_output(stream)
+	if result.dtype!=np.uint16 or not np.array_equal(result, expected):
+		raise AssertionError('decoders differ on %s' % name)
+
+
+def check_streaming(stream, chunk_size=37):
+	""" the stream decoder must not lose samples at chunk borders """
+	decoder = StreamDecoder()
+	result = np.concatenate([decoder.decode(stream[i:i+chunk_size])
+		for i in range(0, len(stream), chunk_size)])
+	if not np.array_equal(result, decode_output(stream)):
+		raise AssertionError('StreamDecoder loses samples at chunk borders')
+
+
+def decode_chunked(stream, chunk_size=200):
+	""" stream decoding in 10 ms chunks of a 10 kHz device """
+	decoder = StreamDecoder()
+	for i in range(0, len(stream), chunk_size):
+		decoder.decode(stream[i:i+chunk_size])
+
+
+def throughput(func, stream, repeat=3):
+	""" best of 'repeat' runs in MB/s """
+	best = np.inf
+	for _ in range(repeat):
+		tstart = time.time()
+		func(stream)
+		best = min(best, time.time() - tstart)
+	return len(stream)/best/1e6
+
+
+def main(argv):
+	stream = synthetic_stream(20000)
+	cases = [('aligned', stream),
+			('misaligned', b'\x05\x17' + stream[3:]),
+			('odd length', stream[:-1]),
+			('no frame start', b'\x01\x02\x03'),
+			('empty', b'')]
+	for path in argv:
+		with open(path, 'rb') as f:
+			cases.append((path, f.read()))
+	for name, data in cases:
+		check_identical(data, name)
+	print('decode_output and decode_output_loop agree on %d streams' % len(cases))
+	check_streaming(synthetic_stream(20000))
+
+	## one second of device data at 10 kHz is 20 kB
+	for nsamples in (1000, 10000, 100000):
+		stream = synthetic_stream(nsamples)
+		loop = throughput(decode_output_loop, stream, repeat=1)
+		vect = throughput(decode_output, stream)
+		chunked = throughput(decode_chunked, stream)
+		print('%7d samples: loop %8.3f MB/s, vectorized %9.1f MB/s (x%.0f), '
+			'streaming in 200 byte chunks %7.1f MB/s'
+			% (nsamples, loop, vect, vect/loop, chunked))
+
+
+if __name__ == "__main__":
+	main(sys.argv[1:])
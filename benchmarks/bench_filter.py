@@ -0,0 +1,58 @@
+"""
+Per-tick cost of band-pass filtering the signal window, refiltering
+the whole window from zero state (former update_monitor) against
+the StreamingFilter that only filters newly arrived samples.
+
+Run from the repository root:
+
+	python -m benchmarks.bench_filter
+
+The streaming output is first checked against a single offline
+lfilter of the same stream.
+"""
+from __future__ import print_function, division
+import time
+import numpy as np
+from scipy.signal import butter, lfilter
+
+from libs.dsp import StreamingFilter
+
+
+def check_offline(b, a, nsamples=50000, seed=0):
+	rng = np.random.RandomState(seed)
+	y = rng.normal(size=nsamples)
+	t = np.arange(nsamples, dtype=float)
+	stream = StreamingFilter(b, a, nsamples)
+	cuts = np.r_[0, np.sort(rng.randint(0, nsamples, size=100)), nsamples]
+	for start, stop in zip(cuts[:-1], cuts[1:]):
+		stream.process(t[start:stop], y[start:stop])
+	if not np.allclose(stream.output.latest()[1], lfilter(b, a, y)):
+		raise AssertionError('streaming and offline filter differ')
+
+
+def per_tick(func, niter=200):
+	tstart = time.time()
+	for _ in range(niter):
+		func()
+	return (time.time() - tstart)/niter*1e6
+
+
+def main():
+	b, a = butter(3, [0.001, 0.34], btype='band')
+	check_offline(b, a)
+	print('StreamingFilter matches offline lfilter')
+
+	## one 10 Hz plot tick at 10 kHz brings 1000 new samples
+	new = 1000
+	print('window   refilter window  streaming   [us/tick]')
+	for window in (1000, 10000, 100000, 1000000):
+		y = np.random.normal(size=window)
+		t = np.arange(new, dtype=float)
+		stream = StreamingFilter(b, a, window)
+		refilter = per_tick(lambda: lfilter(b, a, y), niter=max(5, 10**6//window//5))
+		streaming = per_tick(lambda: stream.process(t, y[:new]))
+		print('%7d %16.1f %10.1f' % (window, refilter, streaming))
+
+
+if __name__ == "__main__":
+	main()
@@ -0,0 +1,98 @@
+"""
+CPU cost of reading 2 to 32 headsets with one ComMonitorThread per
+port against a single SerialMultiplexThread polling all ports.
+
+Run from the repository root:
+
+	python -m benchmarks.bench_multiplex [sample_rate] [duration]
+
+Every device is a pseudo terminal fed with encoded samples at
+sample_rate (default 10 kHz, 20 kB/s) by one writer thread for
+duration seconds (default 3). Reported are the bytes/s delivered to
+the data queues, the reader wakeups/s and the process CPU per second
+of data; the writer is part of every run and sets the floor.
+"""
+from __future__ import print_function, division
+import os, sys, time
+import Queue
+import numpy as np
+
+from acquisition import SerialMultiplexThread
+from com_monitor import ComMonitorThread
+from libs.decode import encode_samples
+
+
+def write_samples(fds, sample_rate, duration, interval=0.005):
+	frames = encode_samples((500 + 100*np.sin(np.arange(int(sample_rate))/10.)).astype(int))
+	tstart = time.time()
+	sent = 0
+	while time.time() - tstart<duration:
+		due = 2*int((time.time() - tstart)*sample_rate)
+		start = sent % len(frames)
+		chunk = frames[start:min(len(frames), start + due - sent)]
+		for fd in fds:
+			os.write(fd, chunk)
+		sent += len(chunk)
+		time.sleep(interval)
+
+
+def drain(queues):
+	nbytes = 0
+	for data_q in queues:
+		while not data_q.empty():
+			nbytes += len(data_q.get()[0])
+	return nbytes
+
+
+def run(mode, ndevices, sample_rate, duration, latency):
+	ptys = [os.openpty() for i in range(ndevices)]
+	ports = [os.ttyname(slave) for master, slave in ptys]
+	queues = [Queue.Queue() for port in ports]
+	if mode=='multiplex':
+		monitors = [SerialMultiplexThread(queues, Queue.Queue(), ports, 230400,
+			sample_rate=sample_rate, latency=latency)]
+	else:
+		monitors = [ComMonitorThread(data_q, Queue.Queue(), port, 230400,
+				sample_rate=sample_rate, read_mode=mode, latency=latency)
+			for port, data_q in zip(ports, queues)]
+	for monitor in monitors:
+		monitor.start()
+	time.sleep(0.5)
+	drain(queues)
+
+	cpu = os.times()
+	tstart = time.time()
+	wakeups = sum(monitor.reader.wakeups if mode!='multiplex' else monitor.wakeups
+		for monitor in monitors)
+	write_samples([master for master, slave in ptys], sample_rate, duration)
+	time.sleep(2*latency)
+	elapsed = time.time() - tstart
+	cpu = sum(os.times()[:2]) - sum(cpu[:2])
+	wakeups = sum(monitor.reader.wakeups if mode!='multiplex' else monitor.wakeups
+		for monitor in monitors) - wakeups
+	nbytes = drain(queues)
+
+	for monitor in monitors:
+		monitor.join(1.)
+	for master, slave in ptys:
+		os.close(master)
+		os.close(slave)
+	return nbytes/elapsed, wakeups/elapsed, cpu/elapsed*1e3
+
+
+def main(argv):
+	sample_rate = float(argv[0]) if argv else 10000.
+	duration = float(argv[1]) if len(argv)>1 else 3.
+	latency = 0.02
+	print('%.0f bytes/s per device, %.0f s per run, %.0f ms latency' % (2*sample_rate,
+		duration, latency*1e3))
+	print('devices  mode       bytes/s   expected  wakeups/s  CPU [ms/s]')
+	for ndevices in (2, 4, 8, 16, 32):
+		for mode in ('legacy', 'bulk', 'multiplex'):
+			rate, wakeups, cpu = run(mode, ndevices, sample_rate, duration, latency)
+			print('%7d  %-9s %9.0f %9.0f %10.0f %11.1f' % (ndevices, mode, rate,
+				2*sample_rate*ndevices, wakeups, cpu))
+
+
+if __name__ == "__main__":
+	main(sys.argv[1:])
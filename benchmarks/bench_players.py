@@ -0,0 +1,80 @@
+"""
+Per-tick processing cost against the number of players, one
+PlayersPipeline per player against a single PlayersPipeline whose
+filters, spectra and band powers run on all players at once.
+
+Run from the repository root:
+
+	python -m benchmarks.bench_players [sample_rate]
+
+One tick is one plot update at 10 Hz: ten blocks of 10 ms of
+samples per player pass resampling, band-pass and recursive band
+power, then the spectra are updated and a snapshot is taken. The
+batched results are first checked against the per player ones.
+"""
+from __future__ import print_function, division
+import sys, time
+import numpy as np
+from scipy.signal import butter
+
+from processing import PlayersPipeline
+
+
+def make_pipeline(nplayers, fs, nmax):
+	b, a = butter(3, [0.001, 0.34], btype='band')
+	return PlayersPipeline(nplayers, fs, 'full', fs, nmax, b, a, 4, 13)
+
+
+def tick(pipelines, signals, t, start, block):
+	""" one plot tick: feed ten blocks to every pipeline """
+	for i in range(10):
+		stop = start + block
+		for pipeline, rows in pipelines:
+			for row, player in enumerate(rows):
+				pipeline.add_samples(row, t[start:stop], signals[player, start:stop])
+			pipeline.process()
+		start = stop
+	for pipeline, rows in pipelines:
+		pipeline.update_spectrum()
+		pipeline.pop_recursive_power(0.1)
+		pipeline.snapshot()
+	return start
+
+
+def run(nplayers, fs, nticks=30):
+	nmax = int(2*fs)
+	block = int(fs/100)
+	n = nmax + (nticks + 1)*10*block
+	rng = np.random.RandomState(0)
+	signals = 500 + 20*rng.normal(size=(nplayers, n))
+	t = np.arange(n)/fs
+
+	separate = [(make_pipeline(1, fs, nmax), [player]) for player in range(nplayers)]
+	batched = [(make_pipeline(nplayers, fs, nmax), list(range(nplayers)))]
+	result = []
+	for pipelines in (separate, batched):
+		start = 0
+		while start<nmax:
+			start = tick(pipelines, signals, t, start, block)
+		tstart = time.time()
+		for i in range(nticks):
+			start = tick(pipelines, signals, t, start, block)
+		result.append((time.time() - tstart)/nticks*1e3)
+
+	spectra = np.array([p.fft_norm[0] for p, rows in separate])
+	if not np.allclose(spectra, batched[0][0].fft_norm):
+		raise AssertionError('batched and per player spectra differ')
+	return result
+
+
+def main(argv):
+	fs = float(argv[0]) if argv else 10000.
+	print('%.0f Hz per player, per tick cost [ms]' % fs)
+	print('players  per player  batched   per player/batched')
+	for nplayers in (1, 2, 4, 8, 16):
+		separate, batched = run(nplayers, fs)
+		print('%7d %11.2f %8.2f %10.2f' % (nplayers, separate, batched, separate/batched))
+
+
+if __name__ == "__main__":
+	main(sys.argv[1:])
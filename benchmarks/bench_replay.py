@@ -0,0 +1,97 @@
+"""
+Maximum sustainable input rate of the processing pipeline, fed by
+ReplayThreads replaying a recorded session as fast as possible, and
+pacing accuracy of real time and accelerated replay.
+
+Run from the repository root:
+
+	python -m benchmarks.bench_replay [session] [seconds]
+
+Without a session path, a synthetic raw session of 'seconds'
+(default 20) of a 10 kHz device is recorded to a temporary
+directory first. Every player replays the same session.
+"""
+from __future__ import print_function, division
+import os, shutil, sys, tempfile, time
+import Queue
+import numpy as np
+from scipy.signal import butter
+
+from acquisition import ReplayThread
+from libs.decode import encode_samples
+from libs.session import SessionWriter, SessionReader
+from processing import PlayersPipeline, Arena, ProcessingWorker
+
+
+def record_synthetic(path, seconds, fs=10000, chunk=100):
+	rng = np.random.RandomState(0)
+	t = np.arange(int(seconds*fs))/fs
+	signal = 500 + 50*np.sin(2*np.pi*10*t) + 20*rng.normal(size=len(t))
+	frames = encode_samples(np.clip(signal, 0, 1023).astype(int))
+	writer = SessionWriter(path, 'raw', fs)
+	for start in range(0, len(t), chunk):
+		writer.write_chunks([(frames[2*start:2*(start + chunk)], t[min(len(t), start + chunk) - 1])])
+	writer.close()
+
+
+def max_rate(path, nplayers):
+	""" samples/s processed when replaying as fast as possible """
+	session = SessionReader(path)
+	fs = session.sample_rate
+	total = len(session.read_samples()[1])*nplayers
+	b, a = butter(3, [0.001, 0.34], btype='band')
+	queues = [Queue.Queue() for i in range(nplayers)]
+	pipeline = PlayersPipeline(nplayers, fs, 'full', fs, int(2*fs), b, a, 4, 13)
+	worker = ProcessingWorker(queues, pipeline, Arena([(-1)**i for i in range(nplayers)]))
+	replays = [ReplayThread(data_q, Queue.Queue(), path, speed=None) for data_q in queues]
+
+	tstart = time.time()
+	worker.start()
+	for replay in replays:
+		replay.start()
+	while np.sum(pipeline.resampler.count)<total:
+		time.sleep(0.01)
+	elapsed = time.time() - tstart
+	worker.join(1.)
+	return total/elapsed
+
+
+def pacing(path, speed, seconds=3.):
+	""" delay behind schedule when replaying at 'speed' """
+	session = SessionReader(path)
+	t0 = session.index['timestamp'][0]
+	data_q = Queue.Queue()
+	replay = ReplayThread(data_q, Queue.Queue(), path, speed=speed,
+		t_stop=t0 + seconds)
+	tstart = time.time()
+	replay.start()
+	replay.finished.wait()
+	return time.time() - tstart, replay.max_delay
+
+
+def main(argv):
+	directory = None
+	if argv and not argv[0].replace('.', '').isdigit():
+		path = argv[0]
+	else:
+		directory = tempfile.mkdtemp()
+		path = os.path.join(directory, 'synthetic')
+		record_synthetic(path, float(argv[0]) if argv else 20.)
+	session = SessionReader(path)
+	print('session %s: %.1f s, %d chunks' % (path, session.duration, len(session)))
+
+	for speed in (1., 10.):
+		elapsed, delay = pacing(path, speed)
+		print('speed %3.0fx: 3 s replayed in %.3f s (expected %.3f s), max delay %.1f ms'
+			% (speed, elapsed, 3./speed, delay*1e3))
+
+	print('players  max input rate [samples/s]  real time factor')
+	for nplayers in (1, 2, 4, 8):
+		rate = max_rate(path, nplayers)
+		print('%7d %27.0f %17.1f' % (nplayers, rate, rate/nplayers/session.sample_rate))
+	if directory is not None:
+		shutil.rmtree(directory)
+
+
+if __name__ == "__main__":
+	main(sys.argv[1:])
@@ -0,0 +1,65 @@
+"""
+Append and read cost of the RingBuffer behind LiveDataFeed for
+capacities from 10^3 to 10^6 samples, compared with the former list
+of (timestamp, temperature) tuples trimmed with pop(0).
+
+Run from the repository root:
+
+	python -m benchmarks.bench_ringbuffer
+
+Each iteration appends a chunk of 100 samples (10 ms at 10 kHz) and
+reads the latest 1000 samples, as one plot tick would.
+"""
+from __future__ import print_function, division
+import time
+import numpy as np
+
+from libs.ringbuffer import RingBuffer
+
+
+def per_iteration(func, niter):
+	tstart = time.time()
+	for i in range(niter):
+		func(i)
+	return (time.time() - tstart)/niter*1e6
+
+
+def bench_ring(capacity, chunk, nread, niter=2000):
+	ring = RingBuffer(capacity)
+	t = np.arange(chunk, dtype=float)
+	y = np.random.normal(size=chunk)
+	## fill once so appends overwrite old samples
+	for i in range(capacity//chunk + 1):
+		ring.extend(t, y)
+	append = per_iteration(lambda i: ring.extend(t, y), niter)
+	read = per_iteration(lambda i: ring.latest(nread), niter)
+	return append, read
+
+
+def bench_list(capacity, chunk, nread, niter=20):
+	data = [(0., 0.)]*capacity
+	t = list(range(chunk))
+	y = list(np.random.normal(size=chunk))
+	def append(i):
+		for item in zip(t, y):
+			data.append(item)
+			if len(data)>capacity:
+				data.pop(0)
+	def read(i):
+		xdata = [s[0] for s in data[-nread:]]
+		ydata = [s[1] for s in data[-nread:]]
+	return per_iteration(append, niter), per_iteration(read, niter)
+
+
+def main():
+	chunk, nread = 100, 1000
+	print('capacity   ring append  ring read   list append  list read   [us/iteration]')
+	for capacity in (10**3, 10**4, 10**5, 10**6):
+		ring_append, ring_read = bench_ring(capacity, chunk, nread)
+		list_append, list_read = bench_list(capacity, chunk, nread)
+		print('%8d %12.2f %10.2f %13.1f %10.1f' % (capacity,
+			ring_append, ring_read, list_append, list_read))
+
+
+if __name__ == "__main__":
+	main()
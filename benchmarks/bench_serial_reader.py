@@ -0,0 +1,119 @@
+"""
+Wakeups, chunk size and CPU cost of the serial read modes of
+ComMonitorThread: 'legacy' (read(1) + read(inWaiting())) against
+'bulk' (one read of a chunk sized for a target latency).
+
+Run from the repository root:
+
+	python -m benchmarks.bench_serial_reader [sample_rate] [duration]
+
+A thread writes encoded samples at sample_rate (default 10 kHz,
+20 kB/s) to the master side of a pseudo terminal, the monitor reads
+the slave side with pyserial for duration seconds (default 5). CPU
+is the process time per second of data, which includes the writer.
+
+Then the copy cost of a bulk read is compared against reading into
+a reusable bytearray (pyserial's readinto, a read plus a copy into
+the buffer, and bytes(buffer[:n])), on a port that returns data
+right away as pyserial builds it.
+"""
+from __future__ import print_function, division
+import os, sys, time, threading
+import Queue
+import numpy as np
+
+from com_monitor import ComMonitorThread
+from libs.decode import encode_samples
+
+
+def write_samples(fd, sample_rate, duration, stop):
+	""" write 1 ms worth of frames every millisecond """
+	frames = encode_samples((500 + 100*np.sin(np.arange(int(sample_rate))/10.)).astype(int))
+	tstart = time.time()
+	sent = 0
+	while not stop.is_set() and time.time() - tstart<duration:
+		due = 2*int((time.time() - tstart)*sample_rate)
+		while sent<due:
+			start = sent % len(frames)
+			sent += os.write(fd, frames[start:min(len(frames), start + due - sent)])
+		time.sleep(0.001)
+
+
+def run(sample_rate, duration, read_mode, latency):
+	master, slave = os.openpty()
+	data_q = Queue.Queue()
+	monitor = ComMonitorThread(data_q, Queue.Queue(), os.ttyname(slave), 230400,
+		sample_rate=sample_rate, read_mode=read_mode, latency=latency)
+	monitor.start()
+	time.sleep(0.3)
+
+	stop = threading.Event()
+	cpu = os.times()
+	tstart = time.time()
+	write_samples(master, sample_rate, duration, stop)
+	elapsed = time.time() - tstart
+	cpu = sum(os.times()[:2]) - sum(cpu[:2])
+	reader = monitor.reader
+	wakeups, nbytes, chunks = reader.wakeups, reader.bytes_read, reader.chunks
+	monitor.join(1.)
+	os.close(master)
+	os.close(slave)
+	return wakeups/elapsed, nbytes/max(1, chunks), nbytes/elapsed, cpu/elapsed*1e3
+
+
+class InstantPort(object):
+	""" Port with data always available; read() and readinto()
+		copy like those of pyserial 3
+	"""
+	def __init__(self, size):
+		self.data = b'\x80\x00'*(size//2 + 1)
+
+	def read(self, size=1):
+		read = bytearray()
+		read.extend(self.data[:size])
+		return bytes(read)
+
+	def readinto(self, b):
+		data = self.read(len(b))
+		n = len(data)
+		b[:n] = data
+		return n
+
+
+def copy_cost(chunk_size, repeat=20000):
+	""" us per read: the read of SerialReader in bulk mode (without
+		its timing), and the former read into a reusable buffer
+	"""
+	port = InstantPort(chunk_size)
+	tstart = time.time()
+	for i in range(repeat):
+		data = port.read(chunk_size)
+	bulk = (time.time() - tstart)/repeat*1e6
+	buffer = bytearray(chunk_size)
+	tstart = time.time()
+	for i in range(repeat):
+		n = port.readinto(buffer)
+		data = bytes(buffer[:n])
+	into = (time.time() - tstart)/repeat*1e6
+	return bulk, into
+
+
+def main(argv):
+	sample_rate = float(argv[0]) if argv else 10000.
+	duration = float(argv[1]) if len(argv)>1 else 5.
+	print('%.0f Hz, %.0f bytes/s, %.0f s per run' % (sample_rate, 2*sample_rate, duration))
+	print('mode    latency  wakeups/s  mean chunk  bytes/s   CPU [ms/s]')
+	runs = [('legacy', 0.01)] + [('bulk', latency) for latency in (0.005, 0.01, 0.02, 0.05, 0.1)]
+	for read_mode, latency in runs:
+		wakeups, chunk, rate, cpu = run(sample_rate, duration, read_mode, latency)
+		print('%-7s %6.0f ms %10.0f %11.0f %8.0f %10.1f' % (read_mode, latency*1e3,
+			wakeups, chunk, rate, cpu))
+	print()
+	print('chunk [bytes]  read [us]  readinto buffer [us]')
+	for chunk_size in (400, 4000, 65536):
+		bulk, into = copy_cost(chunk_size)
+		print('%13d %10.2f %21.2f' % (chunk_size, bulk, into))
+
+
+if __name__ == "__main__":
+	main(sys.argv[1:])
@@ -0,0 +1,62 @@
+"""
+Recording cost and time range access of sessions (libs/session.py).
+
+Run from the repository root:
+
+	python -m benchmarks.bench_session [minutes] [directory]
+
+Records a raw session of 'minutes' (default 60) of a 10 kHz device
+in 10 ms chunks to a temporary directory, then reopens it and reads
+one second at random positions. The samples read back are checked
+against the recorded signal.
+"""
+from __future__ import print_function, division
+import os, shutil, sys, tempfile, time
+import numpy as np
+
+from libs.decode import encode_samples
+from libs.session import SessionWriter, SessionReader
+
+
+def main(argv):
+	minutes = float(argv[0]) if argv else 60.
+	directory = argv[1] if len(argv)>1 else tempfile.mkdtemp()
+	fs, chunk = 10000, 100
+	signal = (500 + 100*np.sin(np.arange(fs)*2*np.pi*7/fs)).astype(np.uint16)
+	frames = encode_samples(signal)
+	nchunks = int(minutes*60*fs/chunk)
+	path = os.path.join(directory, 'bench')
+
+	writer = SessionWriter(path, 'raw', fs)
+	tstart = time.time()
+	for i in range(nchunks):
+		start = (i*chunk) % fs
+		writer.write_chunks([(frames[2*start:2*(start + chunk)], (i + 1)*chunk/fs)])
+	writer.close()
+	write = (time.time() - tstart)/nchunks*1e6
+	size = os.path.getsize(path + '.raw') + os.path.getsize(path + '.idx')
+
+	tstart = time.time()
+	reader = SessionReader(path)
+	open_time = (time.time() - tstart)*1e3
+
+	rng = np.random.RandomState(0)
+	starts = rng.uniform(0, reader.duration - 1, size=200)
+	tstart = time.time()
+	for t in starts:
+		times, samples = reader.read_samples(t, t + 1.)
+	read = (time.time() - tstart)/len(starts)*1e3
+	## chunk timestamps are the time after their last sample
+	first = int(round(times[0]*fs)) - 1
+	if len(samples)!=fs or not np.array_equal(samples, np.roll(signal, -(first % fs))):
+		raise AssertionError('samples read back differ from the recording')
+
+	print('%.0f min at %d Hz: %d chunks, %.1f MB' % (minutes, fs, nchunks, size/1e6))
+	print('write %.1f us/chunk, open %.2f ms, read 1 s at random time %.2f ms'
+		% (write, open_time, read))
+	if len(argv)<2:
+		shutil.rmtree(directory)
+
+
+if __name__ == "__main__":
+	main(sys.argv[1:])
@@ -0,0 +1,138 @@
+"""
+Accuracy and cost of the drift-corrected sample times of SampleClock
+(libs/timebase.py), on simulated devices.
+
+Run from the repository root:
+
+	python -m benchmarks.bench_timebase [minutes]
+
+A 10 kHz device sends 20 ms chunks for 'minutes' (default 6, at
+least 2) of simulated time; every chunk arrives 1 to 7 ms after its
+last sample (seeded random) and every 30 s the link stalls for
+0.2 s, after which the backlog arrives at once. The checks fail
+with an AssertionError:
+
+	drift       the device clock runs 200 ppm slow and 500 ppm fast:
+	            the fitted drift must be within 30 ppm of the truth
+	            on average over the last minute, the spacing of the
+	            sample times within 0.5% of the true period
+	gap         0.5 s of samples are lost on the link: one second
+	            later the times must be within 20 ms of the truth
+	            (without re-anchoring they stay about 0.5 s early)
+	stall       a 0.5 s stall whose backlog arrives late must not be
+	            taken for lost samples
+
+The cost of stamp() per chunk is printed last.
+"""
+from __future__ import print_function, division
+import sys, time
+import numpy as np
+
+from libs.timebase import SampleClock
+
+
+def simulate(seconds, drift=0., fs=10000., chunk=200, stall_every=30., stall=0.2,
+		stalls=(), lost=None, seed=0):
+	""" Chunks of a simulated device as a list of (n, arrival,
+		true_times): the sample count, the arrival of the last
+		sample and the true times of the samples. The device period
+		is (1 + drift)/fs. Stalls start every 'stall_every' seconds
+		and at the times in 'stalls'; 'lost' is a (time, seconds)
+		pair of samples that never arrive.
+	"""
+	rng = np.random.RandomState(seed)
+	period = (1. + drift)/fs
+	nchunks = int(seconds/(chunk*period))
+	true_times = np.arange(nchunks*chunk)*period
+	starts = sorted(list(np.arange(stall_every, seconds, stall_every)) + list(stalls))
+	chunks = []
+	for j in range(nchunks):
+		times = true_times[j*chunk:(j + 1)*chunk]
+		if lost is not None:
+			times = times[(times<lost[0]) | (times>=lost[0] + lost[1])]
+			if len(times)==0:
+				continue
+		arrival = times[-1] + rng.uniform(0.001, 0.007)
+		for start in starts:
+			length = 0.5 if start in stalls else stall
+			if start<=arrival<start + length:
+				arrival = start + length + rng.uniform(0., 0.001)
+		chunks.append((len(times), arrival, times))
+	return chunks
+
+
+def run(clock, chunks):
+	""" Stamp the chunks, returns the arrays (stamps, true times) """
+	stamps = [clock.stamp(n, arrival) for n, arrival, times in chunks]
+	return np.concatenate(stamps), np.concatenate([times for n, arrival, times in chunks])
+
+
+def check_drift(drift, minutes):
+	clock = SampleClock(10000.)
+	chunks = simulate(60.*minutes, drift)
+	last_minute = [c for c in chunks if c[2][0]>=60.*(minutes - 1)]
+	stamps, truth = run(clock, chunks[:len(chunks) - len(last_minute)])
+	estimates = []
+	for n, arrival, times in last_minute:
+		clock.stamp(n, arrival)
+		estimates.append(clock.drift)
+	errors = np.abs(np.array(estimates) - drift)*1e6
+	period = (1. + drift)/10000.
+	spacing = np.max(np.abs(np.diff(stamps)/period - 1.))
+	print('drift %+5.0f ppm: estimate off by %4.1f ppm on average (%4.1f at most) over the '
+		'last minute, spacing within %.3f%% of the period' % (drift*1e6, np.mean(errors),
+		np.max(errors), spacing*100))
+	if np.mean(errors)>30:
+		raise AssertionError('drift of %+.0f ppm estimated %.1f ppm off' % (drift*1e6, np.mean(errors)))
+	if spacing>0.005:
+		raise AssertionError('sample spacing off by %.2f%%' % (spacing*100))
+
+
+def check_gap():
+	lost = (20., 0.5)
+	chunks = simulate(60., lost=lost)
+	errors = {}
+	for name, confirm in (('re-anchored', 3), ('without re-anchoring', 10**9)):
+		clock = SampleClock(10000., confirm=confirm)
+		stamps, truth = run(clock, chunks)
+		after = (truth>=lost[0] + lost[1] + 1.) & (truth<lost[0] + lost[1] + 2.)
+		errors[name] = np.max(np.abs(stamps[after] - truth[after]))
+		print('0.5 s lost, %-20s: error %6.1f ms one second later, %d gaps' % (
+			name, errors[name]*1e3, clock.gaps))
+	if errors['re-anchored']>0.02:
+		raise AssertionError('times %.1f ms off after a gap' % (errors['re-anchored']*1e3))
+
+
+def check_stall():
+	clock = SampleClock(10000.)
+	stamps, truth = run(clock, simulate(60., stalls=[20.]))
+	print('0.5 s stall: %d gaps, times monotonic: %s' % (clock.gaps, np.all(np.diff(stamps)>0)))
+	if clock.gaps:
+		raise AssertionError('a stall was taken for lost samples')
+	if not np.all(np.diff(stamps)>0):
+		raise AssertionError('sample times run backwards')
+
+
+def cost(chunks, repeat=3):
+	""" best of 'repeat' runs in us per chunk """
+	best = np.inf
+	for i in range(repeat):
+		clock = SampleClock(10000.)
+		tstart = time.time()
+		for n, arrival, times in chunks:
+			clock.stamp(n, arrival)
+		best = min(best, time.time() - tstart)
+	return best/len(chunks)*1e6
+
+
+def main(argv):
+	minutes = max(2., float(argv[0])) if argv else 6.
+	for drift in (200e-6, -500e-6):
+		check_drift(drift, minutes)
+	check_gap()
+	check_stall()
+	print('stamp() %.1f us per chunk' % cost(simulate(60.)))
+
+
+if __name__ == "__main__":
+	main(sys.argv[1:])
@@ -0,0 +1,287 @@
+"""
+Benchmark suite of the processing chain, with machine readable
+results and regression checks against a stored baseline.
+
+Run from the repository root:
+
+	python -m benchmarks.run [options] [scenario ...]
+
+Scenarios (all by default):
+
+	decode      decode_output and StreamDecoder throughput [MB/s]
+	feed        LiveDataFeed snapshot hand-over and sample append/read
+	tick        filter, FFT and band power cost of one plot tick of
+	            a two player game [ms]
+	arena       cost of one ball update [us]
+	latency     latency from the device to the frame: simulated
+	            device -> ComMonitorThread -> ProcessingWorker ->
+	            snapshot prepared for drawing as soon as it is
+	            published, by the curve decimation of the monitor
+	            (FrameRenderer, without the Qt paint) [ms]
+
+Input is synthetic unless --input names a recorded raw session (see
+libs/session.py), whose bytes are decoded and whose signal is fed
+to the tick scenario.
+
+Results are written as JSON (--output, default stdout summary only)
+and compared with the baseline (--baseline, default
+benchmarks/baseline.json): every metric worse than the baseline by
+more than --tolerance (relative, default 0.5) is reported and
+makes the run exit with status 1. --save-baseline stores the results
+as new baseline. Baselines are machine specific; store one per
+machine that runs the checks.
+"""
+from __future__ import print_function, division
+import argparse
+import json
+import os
+import platform
+import sys
+import time
+import Queue
+from collections import OrderedDict
+
+import numpy as np
+
+from benchmarks.bench_acquisition import SimulatedSerial, FrameRenderer
+from benchmarks.bench_decode import synthetic_stream, throughput, decode_chunked
+from benchmarks.bench_players import make_pipeline, tick
+from com_monitor import ComMonitorThread
+from engine import design_bandpass
+from libs.decode import decode_output
+from libs.session import SessionReader
+from livedatafeed import LiveDataFeed
+from processing import PlayersPipeline, Arena, ProcessingWorker
+
+
+default_baseline = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'baseline.json')
+
+
+def metric(value, unit, better):
+	""" better: 'higher' or 'lower' """
+	return dict(value=float(value), unit=unit, better=better)
+
+
+def best_of(func, repeat=5):
+	""" shortest of 'repeat' runs of func() in s """
+	best = np.inf
+	for i in range(repeat):
+		tstart = time.time()
+		func()
+		best = min(best, time.time() - tstart)
+	return best
+
+
+def load_session(path):
+	reader = SessionReader(path)
+	if reader.kind!='raw':
+		raise ValueError('%s is not a raw session' % path)
+	return reader
+
+
+def scenario_decode(args):
+	if args.input:
+		stream = load_session(args.input).data.tobytes()
+	else:
+		stream = synthetic_stream(200000)
+	return OrderedDict([
+		('decode_output', metric(throughput(decode_output, stream, repeat=5), 'MB/s', 'higher')),
+		('stream_decoder_200B', metric(throughput(decode_chunked, stream, repeat=5), 'MB/s', 'higher')),
+	])
+
+
+def scenario_feed(args):
+	feed = LiveDataFeed(capacity=100000)
+	snapshot = dict(players=[])
+	def handover(n=10000):
+		for i in range(n):
+			feed.add_data(snapshot)
+			if feed.has_new_data:
+				feed.read_data()
+	## 10 ms blocks at 10 kHz, read back as the plots do
+	t = np.arange(100, dtype=float)
+	y = np.random.normal(size=100)
+	def append_read(n=2000):
+		for i in range(n):
+			feed.append_data(dict(timestamp=t, temperature=y))
+			feed.read_new()
+	return OrderedDict([
+		('handover', metric(10000/best_of(handover), 'snapshots/s', 'higher')),
+		('append_read', metric(2000*100/best_of(append_read), 'samples/s', 'higher')),
+	])
+
+
+def scenario_tick(args, fs=10000., nticks=30):
+	nmax = int(2*fs)
+	block = int(fs/100)
+	n = nmax + (nticks + 1)*10*block
+	if args.input:
+		times, samples = load_session(args.input).read_samples()
+		signal = np.resize(samples.astype(float), n)
+	else:
+		rng = np.random.RandomState(0)
+		signal = 500 + 50*np.sin(2*np.pi*10*np.arange(n)/fs) + 20*rng.normal(size=n)
+	signals = np.vstack([signal, signal[::-1]])
+	t = np.arange(n)/fs
+	pipelines = [(make_pipeline(2, fs, nmax), [0, 1])]
+	start = 0
+	while start<nmax:
+		start = tick(pipelines, signals, t, start, block)
+	ticks = []
+	for i in range(nticks):
+		tstart = time.time()
+		start = tick(pipelines, signals, t, start, block)
+		ticks.append(time.time() - tstart)
+	ticks = np.array(ticks)*1e3
+	return OrderedDict([
+		('median', metric(np.median(ticks), 'ms', 'lower')),
+		('p95', metric(np.percentile(ticks, 95), 'ms', 'lower')),
+	])
+
+
+def scenario_arena(args, n=20000):
+	result = OrderedDict()
+	rng = np.random.RandomState(0)
+	for nplayers in (2, 8):
+		arena = Arena([(-1)**i for i in range(nplayers)])
+		powers = 0.05 + 0.01*rng.normal(size=(n, nplayers))
+		def updates():
+			arena.start()
+			for p in powers:
+				if arena.update(p) is not None:
+					arena.start()
+		result['update_%dplayers' % nplayers] = metric(best_of(updates, 3)/n*1e6, 'us', 'lower')
+	return result
+
+
+def scenario_latency(args, fs=10000., poll=0.002):
+	""" latency from the arrival of the newest sample of a snapshot
+		at the simulated port until the curves of the frame showing
+		it are prepared.
+		The frame loop polls every 'poll' seconds: a loop at the
+		publishing rate would add up to a frame period depending on
+		the phase of the two, which drifts from run to run.
+	"""
+	SimulatedSerial.sample_rate = fs
+	ports = []
+	def factory(**kwargs):
+		ports.append(SimulatedSerial(**kwargs))
+		return ports[-1]
+	data_q = Queue.Queue()
+	monitor = ComMonitorThread(data_q, Queue.Queue(), 'sim', 230400, serial_factory=factory,
+		sample_rate=fs, read_mode='bulk', latency=0.02)
+	b, a = design_bandpass(0., 0.34)
+	nmax = int(2*fs)
+	pipeline = PlayersPipeline(1, fs, 'full', fs, nmax, b, a, 4, 13)
+	worker = ProcessingWorker([data_q], pipeline, Arena([1]))
+	## samples decoded when the snapshot was taken, recorded in
+	## the worker thread
+	frames = LiveDataFeed()
+	worker.subscribers.append(lambda snapshot: frames.add_data(
+		(int(pipeline.resampler.count[0]), snapshot)))
+	monitor.start()
+	worker.start()
+	render = FrameRenderer(1)
+
+	latencies = []
+	tstart = time.time()
+	while time.time() - tstart<args.duration + 1.:
+		tframe = time.time()
+		if frames.has_new_data:
+			nsamples, snapshot = frames.read_data()
+			## the backlog read at startup is not counted
+			if len(snapshot['players'][0]['times']) and tframe - tstart>1.:
+				render(snapshot)
+				arrival = ports[0]._start + nsamples/fs
+				latencies.append(time.time() - arrival)
+		time.sleep(max(0, poll - (time.time() - tframe)))
+	worker.join(1.)
+	monitor.join(1.)
+	if not latencies:
+		raise RuntimeError('no frames rendered')
+	latencies = np.array(latencies)*1e3
+	return OrderedDict([
+		('median', metric(np.median(latencies), 'ms', 'lower')),
+		('p95', metric(np.percentile(latencies, 95), 'ms', 'lower')),
+	])
+
+
+scenarios = OrderedDict([
+	('decode', scenario_decode),
+	('feed', scenario_feed),
+	('tick', scenario_tick),
+	('arena', scenario_arena),
+	('latency', scenario_latency),
+])
+
+
+def compare(results, baseline, tolerance):
+	""" Lines of the comparison table and the list of regressions """
+	lines, regressions = [], []
+	for scenario, metrics in results.items():
+		for name, m in metrics.items():
+			key = '%s.%s' % (scenario, name)
+			base = baseline.get(scenario, {}).get(name)
+			if base is None:
+				lines.append('%-28s %12.3f %-12s %12s' % (key, m['value'], m['unit'], '-'))
+				continue
+			ratio = m['value']/base['value'] if base['value'] else np.inf
+			worse = ratio<1 - tolerance if m['better']=='higher' else ratio>1 + tolerance
+			if worse:
+				regressions.append(key)
+			lines.append('%-28s %12.3f %-12s %12.3f %7.2fx%s' % (key, m['value'], m['unit'],
+				base['value'], ratio, '  REGRESSION' if worse else ''))
+	return lines, regressions
+
+
+def main(argv):
+	parser = argparse.ArgumentParser(description='EEG-Mindball benchmark suite')
+	parser.add_argument('names', nargs='*', metavar='scenario',
+		help='scenarios to run: %s' % ', '.join(scenarios))
+	parser.add_argument('--input', help='recorded raw session to use as input')
+	parser.add_argument('--duration', type=float, default=5., help='latency run time in s')
+	parser.add_argument('--output', '-o', help='write the results as JSON to this file')
+	parser.add_argument('--baseline', default=default_baseline)
+	parser.add_argument('--tolerance', type=float, default=0.5)
+	parser.add_argument('--save-baseline', action='store_true')
+	args = parser.parse_args(argv)
+	for name in args.names:
+		if name not in scenarios:
+			parser.error('unknown scenario %r' % name)
+
+	results = OrderedDict()
+	for name in args.names or scenarios:
+		print('running %s ...' % name, file=sys.stderr)
+		results[name] = scenarios[name](args)
+	report = OrderedDict([
+		('time', time.strftime('%Y-%m-%dT%H:%M:%S')),
+		('python', platform.python_version()),
+		('numpy', np.__version__),
+		('machine', platform.platform()),
+		('input', args.input),
+		('results', results),
+	])
+	if args.output:
+		with open(args.output, 'w') as f:
+			json.dump(report, f, indent=1)
+
+	baseline = {}
+	if os.path.exists(args.baseline) and not args.save_baseline:
+		with open(args.baseline) as f:
+			baseline = json.load(f)['results']
+	lines, regressions = compare(results, baseline, args.tolerance)
+	print('%-28s %12s %-12s %12s' % ('metric', 'value', 'unit', 'baseline'))
+	print('\n'.join(lines))
+
+	if args.save_baseline:
+		with open(args.baseline, 'w') as f:
+			json.dump(report, f, indent=1)
+		print('saved baseline %s' % args.baseline)
+	elif regressions:
+		print('%d regressions: %s' % (len(regressions), ', '.join(regressions)))
+		return 1
+	return 0
+
+
+if __name__ == "__main__":
+	sys.exit(main(sys.argv[1:]))
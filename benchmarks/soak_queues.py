@@ -0,0 +1,162 @@
+"""
+Soak test of the data queues between acquisition and processing:
+memory with a consumer that can not keep up.
+
+Run from the repository root:
+
+	python -m benchmarks.soak_queues [options]
+
+A producer thread posts (data, timestamp) chunks of serial frames
+every 20 ms, like a ComMonitorThread in bulk mode, at --rate bytes
+per second. The consumer takes one chunk per tick at only
+--consumer-rate ticks per second, so the backlog grows. Every
+ChunkQueue policy runs for --duration seconds with --queue-size
+chunks and --queue-bytes bytes, then an unbounded Queue for
+comparison. Reported are the peak of queued chunks and bytes, the
+growth of the resident memory of the process over the second half
+of the run, and the counters of the queue (data lost, chunks
+joined, puts that waited).
+
+Exits with status 1 if a bounded queue held more than its limits or
+the resident memory of a bounded run grew by more than --max-growth
+MB in its second half.
+"""
+from __future__ import print_function, division
+import argparse
+import os
+import sys
+import threading
+import time
+import Queue
+
+import numpy as np
+
+from libs.chunkqueue import ChunkQueue, POLICIES
+from libs.decode import encode_samples
+from libs.timebase import monotonic
+
+
+def rss():
+	""" Resident memory of the process in MB, None where unknown """
+	try:
+		with open('/proc/self/statm') as f:
+			pages = int(f.read().split()[1])
+	except (IOError, OSError):
+		return None
+	return pages*os.sysconf('SC_PAGE_SIZE')/2.**20
+
+
+def queued_bytes(q):
+	if isinstance(q, ChunkQueue):
+		return q.bytes
+	with q.mutex:
+		return sum(len(data) for data, timestamp in q.queue)
+
+
+def soak(q, rate, consumer_rate, duration, interval=0.02):
+	""" Run producer and slow consumer on q. Returns a dict of the
+		peak depth and bytes, produced/consumed chunks and the
+		memory growth over the second half.
+	"""
+	rng = np.random.RandomState(0)
+	n = max(1, int(rate*interval/2))
+	frames = encode_samples(rng.randint(0, 1024, n))
+	alive = threading.Event()
+	alive.set()
+	counts = dict(produced=0, consumed=0)
+
+	def produce():
+		next_chunk = time.time()
+		while alive.isSet():
+			next_chunk += interval
+			time.sleep(max(0, next_chunk - time.time()))
+			try:
+				## a new string per chunk, as read from the port
+				q.put((bytes(bytearray(frames)), monotonic()), True, 0.1)
+			except Queue.Full:
+				continue
+			counts['produced'] += 1
+
+	def consume():
+		while alive.isSet():
+			try:
+				q.get(True, 0.1)
+			except Queue.Empty:
+				continue
+			counts['consumed'] += 1
+			time.sleep(1./consumer_rate)
+
+	threads = [threading.Thread(target=produce), threading.Thread(target=consume)]
+	for thread in threads:
+		thread.daemon = True
+		thread.start()
+	tstart = time.time()
+	peak_depth = peak_bytes = 0
+	rss_half = None
+	while time.time() - tstart<duration:
+		time.sleep(0.1)
+		peak_depth = max(peak_depth, q.qsize())
+		peak_bytes = max(peak_bytes, queued_bytes(q))
+		if rss_half is None and time.time() - tstart>=duration/2:
+			rss_half = rss()
+	rss_end = rss()
+	alive.clear()
+	for thread in threads:
+		thread.join()
+	result = dict(counts, peak_depth=peak_depth, peak_mb=peak_bytes/2.**20,
+		growth_mb=None if rss_end is None or rss_half is None else rss_end - rss_half)
+	## release the backlog before the next run
+	while True:
+		try:
+			q.get_nowait()
+		except Queue.Empty:
+			break
+	return result
+
+
+def main(argv):
+	parser = argparse.ArgumentParser(description='Soak test of the data queue policies')
+	parser.add_argument('--rate', type=float, default=2e6, help='produced bytes per s')
+	parser.add_argument('--consumer-rate', type=float, default=10.,
+		help='chunks taken per s (the producer posts 50)')
+	parser.add_argument('--duration', type=float, default=10., help='seconds per policy')
+	parser.add_argument('--queue-size', type=int, default=100)
+	parser.add_argument('--queue-bytes', type=int, default=4<<20)
+	parser.add_argument('--max-growth', type=float, default=8.,
+		help='allowed memory growth in MB of a bounded run in its second half')
+	parser.add_argument('--no-unbounded', action='store_true',
+		help='skip the unbounded queue')
+	args = parser.parse_args(argv)
+
+	print('%.1f MB/s produced in 50 chunks/s, %.0f chunks/s consumed, %g s per run' % (
+		args.rate/2.**20, args.consumer_rate, args.duration))
+	print('%-12s %9s %9s %8s %9s %10s %11s %9s %8s' % ('policy', 'produced', 'consumed',
+		'depth', 'peak MB', 'growth MB', 'dropped MB', 'coalesced', 'blocked'))
+	failed = []
+	runs = [(policy, ChunkQueue(args.queue_size, policy, args.queue_bytes)) for policy in POLICIES]
+	if not args.no_unbounded:
+		runs.append(('unbounded', Queue.Queue()))
+	for policy, q in runs:
+		result = soak(q, args.rate, args.consumer_rate, args.duration)
+		growth = result['growth_mb']
+		print('%-12s %9d %9d %8d %9.2f %10s %11s %9s %8s' % (policy, result['produced'],
+			result['consumed'], result['peak_depth'], result['peak_mb'],
+			'-' if growth is None else '%.1f' % growth,
+			'%.2f' % (q.dropped_bytes/2.**20) if policy!='unbounded' else '-',
+			getattr(q, 'coalesced', '-'), getattr(q, 'blocked', '-')))
+		sys.stdout.flush()
+		if policy=='unbounded':
+			continue
+		if result['peak_depth']>args.queue_size:
+			failed.append('%s: %d chunks queued' % (policy, result['peak_depth']))
+		if policy!='block' and result['peak_mb']*2**20>args.queue_bytes:
+			failed.append('%s: %.2f MB queued' % (policy, result['peak_mb']))
+		if growth is not None and growth>args.max_growth:
+			failed.append('%s: memory grew by %.1f MB' % (policy, growth))
+	for failure in failed:
+		print('FAILED ' + failure)
+	return 1 if failed else 0
+
+
+if __name__ == "__main__":
+	sys.exit(main(sys.argv[1:]))
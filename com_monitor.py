@@ -4,6 +4,77 @@ import time
 
 import serial
 
+from libs.utils import metrics
+from libs.timebase import monotonic
+
+
+class SerialReader(object):
+    """ Reads chunks of data from an open serial port.
+    
+        mode:
+            'legacy' reads 1 byte, followed by whatever is left
+            in the read buffer, as suggested by the developer of
+            PySerial: two reads and a string concatenation per
+            chunk, and a wakeup at least every port timeout.
+            'bulk' reads up to chunk_size bytes in one call, which
+            returns when chunk_size bytes arrived or the port
+            timeout expired. pyserial builds the returned string
+            once, a reusable buffer would only add copies.
+        
+        chunk_size:
+            Size of a bulk read in bytes. Use chunk_size_for()
+            to derive it from the sample rate and a target
+            latency.
+        
+        bytes_read/wakeups/chunks:
+            Counters of received bytes, read calls and non-empty
+            chunks.
+    
+        Every read is timed in the 'serial.read' histogram of the
+        metrics registry (including the wait for data).
+    """
+    def __init__(self, serial_port, mode='legacy', chunk_size=400):
+        if mode not in ('legacy', 'bulk'):
+            raise ValueError('unknown read mode %r' % mode)
+        self.serial_port = serial_port
+        self.mode = mode
+        self.chunk_size = chunk_size
+        self.bytes_read = 0
+        self.wakeups = 0
+        self.chunks = 0
+        self.timer = metrics.histogram('serial.read')
+        self.byte_counter = metrics.counter('serial.bytes')
+
+    @staticmethod
+    def chunk_size_for(sample_rate, latency, bytes_per_sample=2):
+        """ Bytes arriving within 'latency' seconds, at least one
+            sample
+        """
+        return max(bytes_per_sample, int(sample_rate*latency)*bytes_per_sample)
+
+    @property
+    def mean_chunk_size(self):
+        return self.bytes_read/float(max(1, self.chunks))
+
+    def read(self):
+        """ Returns the next chunk, an empty string on timeout """
+        self.wakeups += 1
+        with self.timer.time():
+            if self.mode=='bulk':
+                data = self.serial_port.read(self.chunk_size)
+            else:
+                data = self.serial_port.read(1)
+                data += self.serial_port.read(self.serial_port.inWaiting())
+        if data:
+            self.bytes_read += len(data)
+            self.chunks += 1
+            self.byte_counter.add(len(data))
+        return data
+
+    def status(self):
+        return '%d bytes in %d chunks (mean %.0f bytes), %d wakeups' % (
+            self.bytes_read, self.chunks, self.mean_chunk_size, self.wakeups)
+
 
 class ComMonitorThread(threading.Thread):
     """ A thread for monitoring a COM port. The COM port is 
@@ -13,8 +84,9 @@ class ComMonitorThread(threading.Thread):
             Queue for received data. Items in the queue are
             (data, timestamp) pairs, where data is a binary 
             string representing the received data, and timestamp
-            is the time elapsed from the thread's start (in 
-            seconds).
+            is the libs.timebase.monotonic() time at which it
+            was received (in seconds). A libs.chunkqueue.ChunkQueue
+            bounds the backlog when the consumer falls behind.
         
         error_q:
             Queue for error messages. In particular, if the 
@@ -33,6 +105,19 @@ class ComMonitorThread(threading.Thread):
             value is low, the thread will return data in finer
             grained chunks, with more accurate timestamps, but
             it will also consume more CPU.
+        
+        sample_rate:
+            Sample rate the device is configured with, in Hz.
+        
+        read_mode/latency:
+            How the port is read, see SerialReader. In 'bulk' mode
+            each read waits for 'latency' seconds worth of samples
+            (at most), which replaces port_timeout: a larger
+            latency means fewer wakeups and less CPU per byte.
+
+        serial_factory:
+            Called with the serial parameters to open the port,
+            serial.Serial by default.
     """
     def __init__(   self, 
                     data_q, error_q, 
@@ -40,7 +125,11 @@ class ComMonitorThread(threading.Thread):
                     port_baud,
                     port_stopbits=serial.STOPBITS_ONE,
                     port_parity=serial.PARITY_NONE,
-                    port_timeout=0.01):#None):
+                    port_timeout=0.01,#None):
+                    serial_factory=serial.Serial,
+                    sample_rate=10000,
+                    read_mode='legacy',
+                    latency=0.02):
         threading.Thread.__init__(self)
         
         self.serial_port = None
@@ -49,6 +138,13 @@ class ComMonitorThread(threading.Thread):
                                 stopbits=port_stopbits,
                                 parity=port_parity,
                                 timeout=port_timeout)
+        self.serial_factory = serial_factory
+        self.sample_rate = sample_rate
+        self.read_mode = read_mode
+        self.chunk_size = SerialReader.chunk_size_for(sample_rate, latency)
+        if read_mode=='bulk':
+            self.serial_arg['timeout'] = latency
+        self.reader = None
 
         self.data_q = data_q
         self.error_q = error_q
@@ -60,29 +156,22 @@ class ComMonitorThread(threading.Thread):
         try:
             if self.serial_port: 
                 self.serial_port.close()
-            self.serial_port = serial.Serial(**self.serial_arg)
+            self.serial_port = self.serial_factory(**self.serial_arg)
             
             #self.serial_port.readline()
             time.sleep(0.2)
-            self.serial_port.write('conf s:10000;c:1;\n')
+            self.serial_port.write('conf s:%d;c:1;\n' % self.sample_rate)
         except serial.SerialException, e:
             self.error_q.put(e.message)
             return
         
         
-        # Restart the clock
-        time.clock()
-        
+        self.reader = SerialReader(self.serial_port, self.read_mode, self.chunk_size)
         while self.alive.isSet():
-            # Reading 1 byte, followed by whatever is left in the
-            # read buffer, as suggested by the developer of 
-            # PySerial.
-            # 
-            data = self.serial_port.read(1)
-            data += self.serial_port.read(self.serial_port.inWaiting())
+            data = self.reader.read()
 
             if len(data) > 0:
-                timestamp = time.clock()
+                timestamp = monotonic()
                 self.data_q.put((data, timestamp))
             
         # clean up
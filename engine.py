@@ -0,0 +1,367 @@
+"""
+Headless EEG-Mindball: acquisition, processing and game logic of a
+match without any GUI. The band power of every player and the ball
+position are written as one line per update to stdout or a file.
+
+	python engine.py [options] PORT [PORT ...]
+
+Players alternate between the left and the right team. With
+--acquisition replay the ports are paths of recorded sessions. Replays
+are processed on the time of the data, one update per update interval
+of the match however fast it is read, and the engine exits when the
+sessions end, e.g. to process a match faster than real time:
+
+	python engine.py --acquisition replay --speed 0 --duration 60 rec/player1 rec/player2
+
+Run with --help for all options.
+"""
+from __future__ import print_function
+import argparse
+import errno
+import json
+import multiprocessing
+import os
+import sys
+import threading
+import time
+import Queue
+
+from scipy.signal import butter
+
+from acquisition import start_acquisition, start_multiplexed
+from processing import PlayersPipeline, Arena, ProcessingWorker
+from libs.session import SessionWriter
+from libs.chunkqueue import ChunkQueue
+from libs.utils import get_all_from_queue, get_item_from_queue, MetricsDumper
+from libs.timebase import monotonic
+
+
+def design_bandpass(low, high, order=3):
+	""" Butterworth band-pass between the normalized frequencies
+		low and high; a band starting at 0 is a low-pass, which
+		scipy does not accept as band.
+	"""
+	if low<=0:
+		return butter(order, high, btype='low')
+	return butter(order, [low, high], btype='band')
+
+
+class GameEngine(object):
+	""" Acquisition, processing and game logic of one match.
+
+		start() opens the headsets and starts the ProcessingWorker,
+		which publishes a snapshot per update: the most recent one
+		in 'snapshots' (a LiveDataFeed, for renderers that only
+		need the latest state) and every one to the callbacks
+		registered with subscribe().
+
+		players:
+			One dict per headset with at least the keys 'port' and
+			'side', optionally 'offset' and 'name' (see
+			PlottingDataMonitor).
+
+		acquisition:
+			'thread', 'process', 'multiplex' or 'replay', see
+			start_acquisition and start_multiplexed.
+
+		window:
+			Length of the signal window of the spectra, in s.
+
+		passband:
+			Normalized band of the signal filter (see
+			design_bandpass).
+
+		max_skew:
+			How long the common time grid of the players waits for
+			a headset whose data lags behind, in s; beyond that
+			its last value is held (see PlayersPipeline). Replays
+			are read at their own pace and always wait for every
+			session.
+
+		queue_size/queue_policy/queue_bytes:
+			Bounds of the data queue of every headset and what
+			happens when the processing falls behind, see
+			ChunkQueue. Replayed sessions always use 'block', as a
+			replay can wait for the worker. The queues are in
+			'queues' while running.
+
+		record_dir:
+			If set, every player is recorded to a session there.
+
+		metrics_file/metrics_interval:
+			If set, the latencies and counters of the pipeline
+			stages (see libs.utils.metrics) are appended to this
+			file as one JSON line every metrics_interval seconds.
+
+		Replays update on the time of the data (see the clock of
+		ProcessingWorker); 'finished' tells when they are done.
+
+		Further options are those of PlayersPipeline, Arena and
+		ProcessingWorker.
+	"""
+	def __init__(self, players, acquisition='thread', sample_rate=10000.,
+			ingest_mode='full', mean_rate=100., window=2., update_freq=10.,
+			band_power_backend='fft', read_mode='bulk', latency=0.02, speed=1.,
+			record_dir=None, passband=(0.0, 0.34), x_low=4, x_high=13,
+			accumulate=False, dc_in_norm=False, damping=0.3, port_baud=230400,
+			metrics_file=None, metrics_interval=10., max_skew=0.5, queue_size=1000,
+			queue_policy='coalesce', queue_bytes=1<<20):
+		self.players = players
+		self.acquisition = acquisition
+		self.sample_rate = sample_rate
+		self.ingest_mode = ingest_mode
+		if ingest_mode=='full':
+			self.fs = sample_rate
+			self.nmax = int(window*sample_rate)
+		else:
+			self.fs = mean_rate
+			self.nmax = 1000
+		self.update_freq = update_freq
+		self.band_power_backend = band_power_backend
+		self.read_mode = read_mode
+		self.latency = latency
+		self.speed = speed
+		self.record_dir = record_dir
+		self.b, self.a = design_bandpass(*passband)
+		self.x_low = x_low
+		self.x_high = x_high
+		self.accumulate = accumulate
+		self.dc_in_norm = dc_in_norm
+		self.port_baud = port_baud
+		self.metrics_file = metrics_file
+		self.metrics_interval = metrics_interval
+		self.max_skew = max_skew
+		self.queue_size = queue_size
+		self.queue_policy = queue_policy
+		self.queue_bytes = queue_bytes
+		self.dumper = None
+
+		self.arena = Arena([player['side'] for player in players], tuning_factor=0.1, damping=damping)
+		self.monitors = []
+		self.queues = []
+		self.worker = None
+		self.subscribers = []
+
+	@property
+	def running(self):
+		return self.worker is not None
+
+	@property
+	def snapshots(self):
+		return self.worker.snapshots if self.worker is not None else None
+
+	@property
+	def finished(self):
+		""" True once every replayed session was posted and taken
+			by the worker
+		"""
+		return (self.acquisition=='replay' and self.running
+			and all(monitor.finished.isSet() for monitor in self.monitors)
+			and all(q.qsize()==0 for q in self.queues))
+
+	def subscribe(self, callback):
+		""" Call callback(snapshot) in the worker thread after every
+			update, also across restarts
+		"""
+		self.subscribers.append(callback)
+		if self.worker is not None:
+			self.worker.subscribers.append(callback)
+
+	def set_band_power_backend(self, backend):
+		self.band_power_backend = backend
+		if self.worker is not None:
+			self.worker.band_power_backend = backend
+
+	def start(self):
+		""" Open the headsets and start processing. Returns the
+			list of error messages of headsets that failed to open.
+		"""
+		if self.running:
+			return []
+		errors = []
+		ports = [player['port'] for player in self.players]
+		policy = 'block' if self.acquisition=='replay' else self.queue_policy
+		self.queues = [ChunkQueue(self.queue_size, policy, self.queue_bytes, name='player%d' % (i + 1))
+			for i in range(len(ports))]
+		if self.acquisition=='multiplex':
+			error_q = Queue.Queue()
+			monitor, sources = start_multiplexed(self.queues,
+				error_q, ports, self.port_baud, self.sample_rate, latency=self.latency)
+			self.monitors.append(monitor)
+			## one error per port that failed to open
+			monitor.opened.wait(2.)
+			errors.extend(get_all_from_queue(error_q))
+		else:
+			sources = []
+			for port, data_q in zip(ports, self.queues):
+				error_q = multiprocessing.Queue() if self.acquisition=='process' else Queue.Queue()
+				monitor, source = start_acquisition(self.acquisition, data_q, error_q,
+					port, self.port_baud, self.sample_rate, read_mode=self.read_mode,
+					latency=self.latency, speed=self.speed)
+				self.monitors.append(monitor)
+				sources.append(source)
+				errors.append(get_item_from_queue(error_q))
+
+		pipeline = PlayersPipeline(len(self.players), self.sample_rate, self.ingest_mode,
+			self.fs, self.nmax, self.b, self.a, self.x_low, self.x_high,
+			offsets=[player.get('offset', 0.) for player in self.players],
+			dc_in_norm=self.dc_in_norm, accumulate=self.accumulate,
+			max_lag=float('inf') if self.acquisition=='replay' else self.max_skew)
+		self.worker = ProcessingWorker(sources, pipeline, self.arena,
+			self.update_freq, self.band_power_backend, recorders=self.create_recorders(),
+			queue_wait=self.acquisition!='replay',
+			clock='data' if self.acquisition=='replay' else 'wall')
+		self.worker.subscribers.extend(self.subscribers)
+		self.worker.start()
+		if self.metrics_file is not None:
+			self.dumper = MetricsDumper(open(self.metrics_file, 'a'), self.metrics_interval)
+			self.dumper.start()
+		return [error for error in errors if error is not None]
+
+	def create_recorders(self):
+		""" One SessionWriter per player if recording is enabled.
+			Shared buffers deliver decoded samples, the other
+			acquisition modes the raw serial chunks.
+		"""
+		if self.record_dir is None:
+			return None
+		kind = 'samples' if self.acquisition=='process' else 'raw'
+		stamp = time.strftime('%Y%m%d_%H%M%S')
+		## timestamps are monotonic(), clock_offset converts them
+		## to wall time
+		clock_offset = time.time() - monotonic()
+		recorders = []
+		for i, player in enumerate(self.players):
+			## a restart within the same second gets a new suffix
+			prefix = os.path.join(self.record_dir, '%s_player%d' % (stamp, i + 1))
+			path, n = prefix, 1
+			while True:
+				try:
+					recorders.append(SessionWriter(path, kind, self.sample_rate,
+						port=player['port'], name=player.get('name'), clock_offset=clock_offset))
+					break
+				except OSError as e:
+					if e.errno!=errno.EEXIST:
+						raise
+					n += 1
+					path = '%s_%d' % (prefix, n)
+		return recorders
+
+	def stop(self, timeout=0.01):
+		for monitor in self.monitors:
+			monitor.join(timeout)
+		self.monitors = []
+		if self.worker is not None:
+			self.worker.join(timeout)
+			self.worker = None
+		if self.dumper is not None:
+			self.dumper.join()
+			self.dumper.out.close()
+			self.dumper = None
+
+
+class StreamWriter(object):
+	""" Subscriber writing one line per update: the time of the
+		newest sample, the band power moving the ball for every
+		player, the ball position and the winner, as JSON ('jsonl')
+		or tab separated values ('tsv').
+	"""
+	def __init__(self, out, fmt='jsonl'):
+		if fmt not in ('jsonl', 'tsv'):
+			raise ValueError('unknown format %r' % fmt)
+		self.out = out
+		self.fmt = fmt
+		self.lines = 0
+		self.lock = threading.Lock()
+
+	def __call__(self, snapshot):
+		times = snapshot['players'][0]['times']
+		t = float(times[-1]) if len(times) else None
+		powers = [float(p) for p in snapshot['powers']]
+		ball = [float(x) for x in snapshot['ball']]
+		if self.fmt=='jsonl':
+			line = json.dumps(dict(t=t, power=powers, ball=ball,
+				playing=snapshot['playing'], winner=snapshot['winner']))
+		else:
+			if self.lines==0:
+				self.out.write('\t'.join(['t'] + ['power%d' % (i + 1) for i in range(len(powers))]
+					+ ['ball_x', 'ball_y', 'playing', 'winner']) + '\n')
+			line = '\t'.join(['%.6f' % t if t is not None else 'nan'] + ['%.6g' % p for p in powers]
+				+ ['%.4f' % x for x in ball] + [str(int(snapshot['playing'])), str(snapshot['winner'])])
+		with self.lock:
+			self.out.write(line + '\n')
+			self.out.flush()
+			self.lines += 1
+
+
+def make_players(ports):
+	""" Player settings for a list of ports, alternately playing to
+		the left and to the right.
+	"""
+	return [dict(port=port, name='player %d' % (i + 1), side=(-1, 1)[i % 2], offset=0.)
+		for i, port in enumerate(ports)]
+
+
+def main(argv):
+	parser = argparse.ArgumentParser(description='Headless EEG-Mindball engine')
+	parser.add_argument('ports', nargs='+', help='serial ports, or session paths to replay')
+	parser.add_argument('--acquisition', default='thread',
+		choices=['thread', 'process', 'multiplex', 'replay'])
+	parser.add_argument('--speed', type=float, default=1.,
+		help='replay speed, 0 for as fast as possible')
+	parser.add_argument('--sample-rate', type=float, default=10000.)
+	parser.add_argument('--update-freq', type=float, default=10.,
+		help='band power and ball updates per second')
+	parser.add_argument('--backend', default='fft', choices=['fft', 'recursive'],
+		help='band power moving the ball')
+	parser.add_argument('--max-skew', type=float, default=0.5,
+		help='seconds to wait for a lagging headset before holding its last value')
+	parser.add_argument('--queue-policy', default='coalesce',
+		choices=['block', 'drop-oldest', 'coalesce'],
+		help='what a full data queue does with new chunks')
+	parser.add_argument('--queue-size', type=int, default=1000, help='chunks per data queue')
+	parser.add_argument('--queue-bytes', type=int, default=1<<20,
+		help='bytes per data queue, 0 for no limit')
+	parser.add_argument('--record', metavar='DIR', help='record the sessions to DIR')
+	parser.add_argument('--output', '-o', help='file to write to instead of stdout')
+	parser.add_argument('--format', default='jsonl', choices=['jsonl', 'tsv'])
+	parser.add_argument('--duration', type=float, help='stop after this many seconds')
+	parser.add_argument('--metrics', metavar='FILE',
+		help='append the stage latencies to FILE periodically')
+	parser.add_argument('--metrics-interval', type=float, default=10.)
+	parser.add_argument('--no-play', action='store_true',
+		help='only stream band power, do not start the game')
+	args = parser.parse_args(argv)
+
+	engine = GameEngine(make_players(args.ports), args.acquisition,
+		sample_rate=args.sample_rate, update_freq=args.update_freq,
+		band_power_backend=args.backend, speed=args.speed or None, record_dir=args.record,
+		metrics_file=args.metrics, metrics_interval=args.metrics_interval,
+		max_skew=args.max_skew, queue_size=args.queue_size, queue_policy=args.queue_policy,
+		queue_bytes=args.queue_bytes or None)
+	out = open(args.output, 'w') if args.output else sys.stdout
+	writer = StreamWriter(out, args.format)
+	engine.subscribe(writer)
+
+	for error in engine.start():
+		print('error: %s' % error, file=sys.stderr)
+	if not args.no_play:
+		engine.arena.start()
+	tstart = time.time()
+	finished = False
+	try:
+		while args.duration is None or time.time() - tstart<args.duration:
+			time.sleep(0.1)
+			finished = engine.finished
+			if finished or engine.arena.winner is not None:
+				break
+	except KeyboardInterrupt:
+		pass
+	## at the end of a replay, let the worker process the last batch
+	engine.stop(None if finished else 1.)
+	if out is not sys.stdout:
+		out.close()
+
+
+if __name__ == "__main__":
+	main(sys.argv[1:])
@@ -0,0 +1,171 @@
+import collections
+import Queue
+
+import numpy as np
+
+from libs.utils import metrics
+
+
+POLICIES = ('block', 'drop-oldest', 'coalesce')
+
+
+class ChunkQueue(Queue.Queue):
+	""" Bounded queue of the (data, timestamp) chunks of a headset,
+		between the thread reading the port and the ProcessingWorker.
+
+		maxsize:
+			Number of chunks the queue holds at most.
+
+		policy:
+			What put() does when the queue is full:
+			'block' waits until the consumer took a chunk, which
+				stalls the reading thread (the serial driver then
+				buffers and eventually loses data), suitable for
+				replays that can wait.
+			'drop-oldest' discards the oldest chunk.
+			'coalesce' joins all queued chunks into one, keeping
+				every byte and the timestamp of the newest, so the
+				consumer decodes the backlog in one go.
+
+		max_bytes:
+			With 'drop-oldest' and 'coalesce', the oldest data is
+			discarded while more than this many bytes are queued,
+			which bounds the memory also when chunks are coalesced.
+			None for no limit.
+
+		name:
+			If set, the counters are also recorded in the metrics
+			registry as queue.<name>.dropped, .coalesced and
+			.blocked, the high water mark as gauge
+			queue.<name>.high_water.
+
+		bytes/high_water/dropped/dropped_bytes/coalesced/blocked:
+			Bytes queued, largest number of chunks queued so far,
+			chunks and bytes discarded, chunks joined into others
+			and puts that had to wait.
+
+		The consumer takes everything queued with drain(), which
+		holds the lock only to swap the chunks out, instead of one
+		get() per chunk. drain() also reports the bytes discarded
+		since the previous drain, so that the consumer can account
+		for the lost samples; get() does not.
+	"""
+	def __init__(self, maxsize=1000, policy='coalesce', max_bytes=None, name=None):
+		if policy not in POLICIES:
+			raise ValueError('unknown queue policy %r' % policy)
+		## only 'block' lets Queue wait for room, the other
+		## policies make room in _put
+		Queue.Queue.__init__(self, maxsize if policy=='block' else 0)
+		self.limit = maxsize
+		self.policy = policy
+		self.max_bytes = max_bytes
+		self.name = name
+		self.bytes = 0
+		self.high_water = 0
+		self.dropped = 0
+		self.dropped_bytes = 0
+		self.undrained_drops = 0
+		self.coalesced = 0
+		self.blocked = 0
+		if name is not None:
+			self.dropped_counter = metrics.counter('queue.%s.dropped' % name)
+			self.coalesced_counter = metrics.counter('queue.%s.coalesced' % name)
+			self.blocked_counter = metrics.counter('queue.%s.blocked' % name)
+			self.high_water_gauge = metrics.gauge('queue.%s.high_water' % name)
+		else:
+			self.dropped_counter = self.coalesced_counter = self.blocked_counter = None
+			self.high_water_gauge = None
+
+	def put(self, item, block=True, timeout=None):
+		if self.policy=='block' and block and self.full():
+			self.blocked += 1
+			if self.blocked_counter is not None:
+				self.blocked_counter.add()
+		Queue.Queue.put(self, item, block, timeout)
+
+	def _drop_oldest(self):
+		data, timestamp = self.queue.popleft()
+		self.bytes -= len(data)
+		self.dropped += 1
+		self.dropped_bytes += len(data)
+		self.undrained_drops += len(data)
+		if self.dropped_counter is not None:
+			self.dropped_counter.add()
+
+	def _trim(self):
+		""" Discard the oldest data beyond max_bytes, cutting into
+			the oldest chunk rather than dropping a coalesced backlog
+			as a whole (the decoder resynchronizes on the cut)
+		"""
+		while len(self.queue)>1 and self.bytes>self.max_bytes:
+			excess = self.bytes - self.max_bytes
+			data, timestamp = self.queue[0]
+			if len(data)<=excess:
+				self._drop_oldest()
+			else:
+				self.queue[0] = (data[excess:], timestamp)
+				self.bytes -= excess
+				self.dropped_bytes += excess
+				self.undrained_drops += excess
+				break
+
+	def _coalesce(self):
+		n = len(self.queue)
+		data = b''.join(chunk for chunk, timestamp in self.queue)
+		timestamp = self.queue[-1][1]
+		self.queue.clear()
+		self.queue.append((data, timestamp))
+		self.coalesced += n - 1
+		if self.coalesced_counter is not None:
+			self.coalesced_counter.add(n - 1)
+
+	## called by Queue with the mutex held
+
+	def _put(self, item):
+		if self.policy!='block' and self.limit>0 and len(self.queue)>=self.limit:
+			if self.policy=='drop-oldest':
+				self._drop_oldest()
+			else:
+				self._coalesce()
+		self.queue.append(item)
+		self.bytes += len(item[0])
+		if self.max_bytes is not None and self.policy!='block':
+			self._trim()
+		if len(self.queue)>self.high_water:
+			self.high_water = len(self.queue)
+			if self.high_water_gauge is not None:
+				self.high_water_gauge.set(self.high_water)
+
+	def _get(self):
+		item = self.queue.popleft()
+		self.bytes -= len(item[0])
+		return item
+
+	def drain(self, timeout=0.):
+		""" Take all queued chunks in one lock acquisition, waiting
+			up to 'timeout' seconds for the first if the queue is
+			empty. Returns (data, ends, timestamps, dropped): the
+			chunks joined into one string, the offsets in data at
+			which every chunk ends, the timestamps of the chunks and
+			the number of bytes discarded before them since the
+			last drain; None if nothing arrived.
+		"""
+		with self.not_empty:
+			if not self.queue and timeout>0:
+				self.not_empty.wait(timeout)
+			if not self.queue:
+				return None
+			chunks, self.queue = self.queue, collections.deque()
+			self.bytes = 0
+			dropped, self.undrained_drops = self.undrained_drops, 0
+			self.not_full.notify_all()
+		n = len(chunks)
+		ends = np.cumsum(np.fromiter((len(data) for data, timestamp in chunks), int, n))
+		timestamps = np.fromiter((timestamp for data, timestamp in chunks), float, n)
+		if n==1:
+			return chunks[0][0], ends, timestamps, dropped
+		return b''.join([data for data, timestamp in chunks]), ends, timestamps, dropped
+
+	def status(self):
+		return '%d/%d chunks (%d max), %d dropped, %d coalesced, %d blocked' % (
+			self.qsize(), self.limit, self.high_water, self.dropped, self.coalesced, self.blocked)
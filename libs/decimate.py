@@ -0,0 +1,97 @@
+import numpy as np
+
+
+def minmax_decimate(x, y, dx):
+	""" Reduce the curve (x, y), x ascending, to the minimum and
+		maximum of y in every bin of width dx.
+
+		Bins are aligned to multiples of dx, so the envelope of a
+		scrolling signal does not change with the position of the
+		window. Every bin becomes a vertical segment from its
+		minimum to its maximum at the x of its first sample, which
+		keeps peaks visible however many samples fall into a pixel.
+		Returns (x, y) with two points per non-empty bin.
+	"""
+	x = np.asarray(x)
+	y = np.asarray(y)
+	if len(x)==0:
+		return x, y
+	bins = np.floor(x/dx)
+	starts = np.r_[0, np.flatnonzero(np.diff(bins)) + 1]
+	xout = np.repeat(x[starts], 2)
+	yout = np.empty(2*len(starts), dtype=y.dtype)
+	yout[0::2] = np.minimum.reduceat(y, starts)
+	yout[1::2] = np.maximum.reduceat(y, starts)
+	return xout, yout
+
+
+class CurveDecimator(object):
+	""" Prepares the data of one plot curve for drawing.
+
+		update(x, y, visible, npixels) cuts the curve to the visible
+		x range (xmin, xmax), reduces it to about two points per
+		horizontal pixel with minmax_decimate if it is longer, and
+		returns the result, or None if it is the same as drawn last
+		time, in which case the curve does not need to be touched.
+
+		updates/skipped:
+			Number of calls that returned new data and that found
+			nothing changed.
+	"""
+	def __init__(self):
+		self.x = None
+		self.y = None
+		self.updates = 0
+		self.skipped = 0
+
+	def reset(self):
+		self.x = None
+		self.y = None
+
+	def update(self, x, y, visible=None, npixels=1000):
+		x = np.asarray(x)
+		y = np.asarray(y)
+		if visible is not None and len(x):
+			## one point beyond each edge, so the line reaches it
+			start = max(0, np.searchsorted(x, visible[0], 'left') - 1)
+			stop = np.searchsorted(x, visible[1], 'right') + 1
+			x, y = x[start:stop], y[start:stop]
+		npixels = max(1, int(npixels))
+		if len(x)>2*npixels:
+			span = visible[1] - visible[0] if visible is not None else x[-1] - x[0]
+			x, y = minmax_decimate(x, y, span/float(npixels))
+		if (self.x is not None and len(x)==len(self.x)
+				and np.array_equal(x, self.x) and np.array_equal(y, self.y)):
+			self.skipped += 1
+			return None
+		self.x, self.y = x, y
+		self.updates += 1
+		return x, y
+
+
+class RangeKeeper(object):
+	""" Sets the x range of a plot only when it moved by at least
+		one pixel, sparing the axis and grid relayout of setXRange
+		on every frame.
+
+		set_range(plot, xmin, xmax) returns True if the range was
+		changed.
+	"""
+	def __init__(self, padding=None):
+		self.padding = padding
+		self.xrange = None
+
+	def reset(self):
+		self.xrange = None
+
+	def set_range(self, plot, xmin, xmax, npixels=1000):
+		if self.xrange is not None:
+			tolerance = (xmax - xmin)/max(1., float(npixels))
+			if abs(xmin - self.xrange[0])<tolerance and abs(xmax - self.xrange[1])<tolerance:
+				return False
+		self.xrange = (xmin, xmax)
+		if self.padding is None:
+			plot.setXRange(xmin, xmax)
+		else:
+			plot.setXRange(xmin, xmax, self.padding)
+		return True
@@ -1,7 +1,139 @@
 import numpy as np
 
 def decode_output(line):
-	line = np.fromstring(line,dtype=np.uint8)
+	""" Decode a binary string of 2-byte frames into an array of
+		uint16 samples.
+
+		A frame starts with a byte whose most significant bit is set,
+		it carries the upper 7 bits of the sample, the following byte
+		the lower 7 bits. Bytes in front of the first frame start are
+		skipped, an odd trailing byte is dropped.
+	"""
+	line = np.frombuffer(line, dtype=np.uint8)
+	## first frame start, the last byte cannot start a full frame
+	start = np.flatnonzero(line[:-1]>127)
+	if len(start)==0:
+		return np.zeros(0, dtype=np.uint16)
+	line = line[start[0]:]
+	nframes = len(line)//2
+
+	##extract samples from pairs of bytes
+	result = (line[0:2*nframes:2] & 127).astype(np.uint16)*np.uint16(128)
+	result += line[1:2*nframes:2]
+	return result
+
+
+def encode_samples(samples):
+	""" Encode samples (0 <= sample < 2**14) into the 2-byte frames
+		sent by the device, the inverse of decode_output.
+	"""
+	samples = np.asarray(samples, dtype=np.uint16)
+	frames = np.empty(2*len(samples), dtype=np.uint8)
+	frames[0::2] = (samples >> 7) | 128
+	frames[1::2] = samples & 127
+	return frames.tobytes()
+
+
+class StreamDecoder(object):
+	""" Incremental decoder for the 2-byte frames of a serial stream
+		that arrives in chunks of arbitrary length.
+		
+		A frame split between two chunks is kept and completed with
+		the next chunk, so every sample is decoded exactly once and
+		the stream is only resynchronized when it is corrupted.
+		
+		Link quality counters:
+		
+		samples:
+			Number of decoded samples.
+		
+		sync_losses:
+			Number of times the expected frame start byte did not
+			have its high bit set and the decoder had to search for
+			the next frame start.
+		
+		corrupted_frames:
+			Number of frames dropped, either because of a sync loss
+			or because the data byte of a frame was missing (a frame
+			start byte was followed by another frame start byte).
+		
+		discarded_bytes:
+			Number of bytes that could not be decoded.
+	"""
+	def __init__(self):
+		self.reset()
+	
+	def reset(self):
+		self.synced = False
+		self._pending = np.zeros(0, dtype=np.uint8)
+		self.samples = 0
+		self.sync_losses = 0
+		self.corrupted_frames = 0
+		self.discarded_bytes = 0
+	
+	def decode(self, chunk):
+		""" Decode the next chunk of the stream and return the
+			completed samples as an uint16 array.
+		"""
+		data = np.frombuffer(chunk, dtype=np.uint8)
+		if len(self._pending):
+			data = np.concatenate((self._pending, data))
+		n = len(data)
+		
+		is_start = data>127
+		starts = np.flatnonzero(is_start)
+		## positions p where no valid frame starts, separately for
+		## frames aligned to even and odd offsets
+		invalid = ~(is_start[:-1] & ~is_start[1:])
+		bad = (np.flatnonzero(invalid[0::2])*2, np.flatnonzero(invalid[1::2])*2 + 1)
+		
+		result = np.empty(n//2, dtype=np.uint16)
+		nresult = 0
+		pos = 0
+		while True:
+			if not self.synced:
+				i = np.searchsorted(starts, pos)
+				if i==len(starts):
+					self.discarded_bytes += n - pos
+					pos = n
+					break
+				self.discarded_bytes += starts[i] - pos
+				pos = starts[i]
+				self.synced = True
+			
+			## decode all valid frames up to the next corrupted one
+			last = pos + 2*((n - pos)//2)
+			bad_pos = bad[pos%2]
+			i = np.searchsorted(bad_pos, pos)
+			end = bad_pos[i] if (i<len(bad_pos) and bad_pos[i]<last) else last
+			k = (end - pos)//2
+			result[nresult:nresult+k] = (data[pos:end:2] & 127).astype(np.uint16)*np.uint16(128)
+			result[nresult:nresult+k] += data[pos+1:end:2]
+			nresult += k
+			pos = end
+			if end==last:
+				break
+			
+			self.corrupted_frames += 1
+			if is_start[pos]:
+				## data byte missing, the next byte starts a new frame
+				self.discarded_bytes += 1
+				pos += 1
+			else:
+				self.sync_losses += 1
+				self.synced = False
+		
+		## keep an incomplete trailing frame for the next chunk
+		self._pending = data[pos:].copy()
+		self.samples += nresult
+		return result[:nresult]
+
+
+def decode_output_loop(line):
+	""" Reference per-byte implementation of decode_output, kept
+		for benchmarking and comparison.
+	"""
+	line = np.frombuffer(line,dtype=np.uint8)
 	foundBeginingOfFrame = 0
 	delta = 1
 	result = []
@@ -27,5 +159,3 @@ def decode_output(line):
 			result.append(intout)
 			i += 2
 	return result
-			
-	
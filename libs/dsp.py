@@ -0,0 +1,337 @@
+import numpy as np
+from numpy.lib.stride_tricks import as_strided
+from scipy.signal import butter, lfilter, lfilter_zi, get_window
+
+from libs.ringbuffer import RingBuffer
+
+
+class StreamingFilter(object):
+	""" IIR filter (b, a) applied to a stream of samples block by
+		block. The filter state is kept between blocks, so only the
+		newly arrived samples are filtered and the result equals a
+		single lfilter over the whole stream.
+
+		The filtered samples and their times are appended to the
+		RingBuffer 'output' holding the most recent 'capacity'
+		samples, which plots and spectra read directly.
+
+		steady_start:
+			If True, the state is initialized with the steady state
+			response to the first sample instead of zeros, which
+			avoids the startup transient of a signal with a large
+			offset.
+
+		channels:
+			If given, blocks are arrays of shape (channels, n) and
+			all channels are filtered by one lfilter call.
+	"""
+	def __init__(self, b, a, capacity, steady_start=False, channels=None):
+		self.b = np.atleast_1d(b)
+		self.a = np.atleast_1d(a)
+		self.steady_start = steady_start
+		self.output = RingBuffer(capacity, channels=channels)
+		self.reset()
+
+	def reset(self):
+		self.zi = None
+		self.output.clear()
+
+	def process(self, times, values):
+		""" Filter the next block of samples and return the
+			filtered block.
+		"""
+		values = np.asarray(values)
+		if values.shape[-1]==0:
+			return np.zeros(values.shape)
+		if self.zi is None:
+			zi = lfilter_zi(self.b, self.a)
+			self.zi = zi*values[..., :1] if self.steady_start else np.zeros(values.shape[:-1] + zi.shape)
+		filtered, self.zi = lfilter(self.b, self.a, values, zi=self.zi)
+		self.output.extend(times, filtered)
+		return filtered
+
+
+class SpectralEstimator(object):
+	""" Normalized magnitude spectrum and band power of the most
+		recent 'nmax' samples of a signal sampled with spacing d.
+
+		The taper window, the frequency axis and the index range of
+		the band x_low < f < x_high are computed once and reused for
+		every update; spectrum and band power are written to
+		preallocated outputs.
+
+		window:
+			Taper applied to each segment, any window accepted by
+			scipy.signal.get_window. None is a rectangular window.
+
+		nperseg/overlap:
+			With nperseg < nmax the spectrum is the Welch average
+			over segments of nperseg samples overlapping by the
+			given fraction. By default a single segment spans the
+			whole window.
+
+		dc_in_norm:
+			The spectrum excludes the DC component and is normalized
+			to sum 1. If dc_in_norm is True, the DC component is
+			included in the normalization sum.
+
+		channels:
+			If given, the signal is an array of shape (channels, n)
+			and the spectra (channels, nfreq) and band powers
+			(channels,) of all rows are computed by single calls.
+	"""
+	def __init__(self, nmax, d, x_low, x_high, window=None, nperseg=None,
+			overlap=0.5, dc_in_norm=False, channels=None):
+		self.nmax = nmax
+		self.nperseg = nperseg or nmax
+		self.step = max(1, int(self.nperseg*(1 - overlap)))
+		self.nseg = 1 + (nmax - self.nperseg)//self.step
+		self.x_low = x_low
+		self.x_high = x_high
+		self.dc_in_norm = dc_in_norm
+
+		if window is None:
+			self.taper = np.ones(self.nperseg)
+		else:
+			self.taper = get_window(window, self.nperseg)
+		self.nfreq = self.nperseg//2
+		lead = () if channels is None else (channels,)
+		self._segments = np.empty(lead + (self.nseg, self.nperseg))
+		self._magnitude = np.empty(lead + (self.nseg, self.nfreq + 1))
+		self.spectrum = np.zeros(lead + (self.nfreq,))
+		self.band_power = np.zeros(lead)
+
+		self.d = None
+		self.set_spacing(d)
+
+	def set_spacing(self, d, rtol=1e-3):
+		""" Set the sample spacing. The frequency axis and the band
+			are only recomputed if d changed by more than rtol.
+		"""
+		if self.d is not None and abs(d - self.d)<=rtol*self.d:
+			return
+		self.d = d
+		self.freq = np.fft.rfftfreq(self.nperseg, d=d)[1:]
+		self.band = slice(int(np.searchsorted(self.freq, self.x_low, 'right')),
+			int(np.searchsorted(self.freq, self.x_high, 'left')))
+
+	def update(self, values):
+		""" Estimate the spectrum of the last nmax samples of values.
+			Returns (spectrum, band_power), the spectrum array is
+			overwritten by the next update. Raises ValueError if
+			values holds fewer samples than the segments span.
+		"""
+		span = (self.nseg - 1)*self.step + self.nperseg
+		if np.shape(values)[-1]<span:
+			raise ValueError('%d samples given, the spectrum needs %d' % (np.shape(values)[-1], span))
+		values = np.ascontiguousarray(values[..., -span:])
+		stride = values.strides[-1]
+		segments = as_strided(values, shape=values.shape[:-1] + (self.nseg, self.nperseg),
+			strides=values.strides[:-1] + (self.step*stride, stride))
+		np.multiply(segments, self.taper, out=self._segments)
+
+		np.abs(np.fft.rfft(self._segments, axis=-1), out=self._magnitude)
+		np.mean(self._magnitude[..., 1:], axis=-2, out=self.spectrum)
+		norm = np.sum(self.spectrum, axis=-1, keepdims=True)
+		if self.dc_in_norm:
+			norm += np.mean(self._magnitude[..., :1], axis=-2)
+		self.spectrum /= np.where(norm>0, norm, 1.)
+		self.band_power = np.sum(self.spectrum[..., self.band], axis=-1)
+		return self.spectrum, self.band_power
+
+
+class RecursiveBandPower(object):
+	""" Relative power in the band x_low < f < x_high, updated with
+		constant cost per sample.
+
+		The signal is split by two IIR filters into the band (band-
+		pass) and the broadband signal without its slow drift (high-
+		pass at x_min). The squared outputs are smoothed by one-pole
+		low-pass filters with time constant tau, their ratio is the
+		fraction of the signal power in the band. All filter states
+		are kept between blocks.
+
+		fs:
+			Sample rate in Hz.
+
+		channels:
+			If given, blocks are arrays of shape (channels, n) and
+			the band power of every row is returned.
+	"""
+	def __init__(self, fs, x_low, x_high, tau=1., order=2, x_min=1., channels=None):
+		self.lead = () if channels is None else (channels,)
+		self.x_low = x_low
+		self.x_high = x_high
+		self.tau = tau
+		self.order = order
+		self.x_min = x_min
+		self.set_rate(fs)
+
+	def set_rate(self, fs, rtol=1e-2):
+		""" (Re)design the filters for sample rate fs and reset the
+			filter states, unless fs changed by less than rtol.
+		"""
+		if getattr(self, 'fs', None) and abs(fs - self.fs)<=rtol*self.fs:
+			return
+		self.fs = float(fs)
+		nyq = self.fs/2.
+		self.b_band, self.a_band = butter(self.order,
+			[self.x_low/nyq, self.x_high/nyq], btype='band')
+		self.b_total, self.a_total = butter(self.order, self.x_min/nyq, btype='high')
+		alpha = 1. - np.exp(-1./(self.tau*self.fs))
+		self.b_env, self.a_env = np.array([alpha]), np.array([1., alpha - 1.])
+		self.reset()
+
+	def reset(self):
+		self.zi_band = np.zeros(self.lead + (max(len(self.a_band), len(self.b_band)) - 1,))
+		self.zi_total = np.zeros(self.lead + (max(len(self.a_total), len(self.b_total)) - 1,))
+		self.zi_env_band = np.zeros(self.lead + (1,))
+		self.zi_env_total = np.zeros(self.lead + (1,))
+		self.band_power = np.zeros(self.lead)
+
+	def update(self, values):
+		""" Process the next block of samples and return the relative
+			band power after each sample.
+		"""
+		values = np.asarray(values)
+		if values.shape[-1]==0:
+			return np.zeros(values.shape)
+		band, self.zi_band = lfilter(self.b_band, self.a_band, values, zi=self.zi_band)
+		total, self.zi_total = lfilter(self.b_total, self.a_total, values, zi=self.zi_total)
+		band, self.zi_env_band = lfilter(self.b_env, self.a_env, band*band, zi=self.zi_env_band)
+		total, self.zi_env_total = lfilter(self.b_env, self.a_env, total*total, zi=self.zi_env_total)
+		power = band/np.maximum(total, np.finfo(float).tiny)
+		self.band_power = power[..., -1]
+		return power
+
+
+class UniformResampler(object):
+	""" Linear interpolation of irregularly timestamped samples of
+		one or more channels onto a common uniform time grid, block
+		by block.
+
+		The samples of each channel are added with add(channel,
+		times, values); process() computes the grid points up to
+		the newest sample present in all channels, but no more than
+		max_lag seconds behind the newest sample of any channel, so
+		that a silent channel does not stall the others (it holds
+		its last value meanwhile). The last sample before the grid
+		end is kept to interpolate across block borders, and the
+		grid offsets are preallocated.
+
+		rate:
+			Nominal output sample rate in Hz.
+
+		channels:
+			Number of channels sharing the grid.
+
+		measure:
+			If True, the grid spacing d is the mean spacing of all
+			input samples so far (averaged over the channels)
+			instead of 1/rate, so that effective_rate is the
+			measured input rate.
+
+		max_lag:
+			Maximum skew between the channels in s: the grid waits
+			at most this long for the slowest channel.
+
+		Alignment accounting, updated by add() and process():
+
+		padded/dropped:
+			Per channel, grid points filled with the held last
+			value because the channel's samples had not arrived
+			yet (or zeros before its first sample), and samples
+			that arrived after the grid had passed them and only
+			serve as interpolation anchor.
+
+		delay/skew:
+			Of the last process() call: how far the grid end trails
+			the newest sample of any channel, and the spread of the
+			newest samples of the channels, in s.
+	"""
+	def __init__(self, rate, channels=1, measure=True, max_lag=0.5, capacity=100000):
+		self.rate = float(rate)
+		self.channels = channels
+		self.measure = measure
+		self.max_lag = max_lag
+		self._offsets = np.arange(capacity, dtype=float)
+		self._grid = np.empty(capacity)
+		self.reset()
+
+	def reset(self):
+		self.d = 1./self.rate
+		self.count = np.zeros(self.channels, dtype=int)
+		self.t_first = np.full(self.channels, np.nan)
+		self.t_newest = np.full(self.channels, np.nan)
+		self.t_next = None
+		self._spacing = np.full(self.channels, np.nan)
+		self._pending = [[] for i in range(self.channels)]
+		self.padded = np.zeros(self.channels, dtype=int)
+		self.dropped = np.zeros(self.channels, dtype=int)
+		self.delay = 0.
+		self.skew = 0.
+
+	@property
+	def effective_rate(self):
+		return 1./self.d
+
+	def add(self, channel, times, values):
+		""" Queue a block of samples of one channel """
+		if len(times)==0:
+			return
+		if self.count[channel]==0:
+			self.t_first[channel] = times[0]
+		self.count[channel] += len(times)
+		self.t_newest[channel] = times[-1]
+		if self.t_next is not None and times[0]<self.t_next - self.d:
+			self.dropped[channel] += np.searchsorted(times, self.t_next - self.d, 'left')
+		self._pending[channel].append((times, values))
+		if self.count[channel]>1 and times[-1]>self.t_first[channel]:
+			self._spacing[channel] = (times[-1] - self.t_first[channel])/(self.count[channel] - 1)
+
+	def process(self, until=None):
+		""" Interpolate the queued samples and return the arrays
+			(grid_times, values) of the new grid points, values
+			having one row per channel. grid_times is overwritten
+			by the next call. If 'until' is given, the grid stops
+			there and the later samples wait for the next call.
+		"""
+		have = self.count>0
+		if not np.any(have):
+			return np.zeros(0), np.zeros((self.channels, 0))
+		if self.measure and np.any(np.isfinite(self._spacing)):
+			self.d = np.nanmean(self._spacing)
+		if self.t_next is None:
+			self.t_next = np.min(self.t_first[have])
+		newest = self.t_newest[have]
+		t_stop = max(np.min(newest), np.max(newest) - self.max_lag)
+		self.delay = np.max(newest) - t_stop
+		self.skew = np.max(newest) - np.min(newest) if np.all(have) else self.delay
+		if until is not None:
+			t_stop = min(t_stop, until)
+
+		k = 0
+		if t_stop>=self.t_next:
+			k = int((t_stop - self.t_next)/self.d) + 1
+		if k>len(self._offsets):
+			self._offsets = np.arange(k, dtype=float)
+			self._grid = np.empty(k)
+		grid = np.multiply(self._offsets[:k], self.d, out=self._grid[:k])
+		grid += self.t_next
+		resampled = np.zeros((self.channels, k))
+		if k==0:
+			return grid, resampled
+
+		## grid points past a channel's newest sample hold its value
+		self.padded += k - np.searchsorted(grid, np.nan_to_num(self.t_newest) + 1e-6*self.d, 'right')*have
+		for channel, pending in enumerate(self._pending):
+			if not pending:
+				continue
+			times = np.concatenate([block[0] for block in pending])
+			values = np.concatenate([block[1] for block in pending])
+			resampled[channel] = np.interp(grid, times, values)
+			## keep the last sample up to the grid end and all later ones
+			j = max(0, np.searchsorted(times, grid[-1], 'right') - 1)
+			self._pending[channel] = [(times[j:], values[j:])]
+		self.t_next = grid[-1] + self.d
+		return grid, resampled
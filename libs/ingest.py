@@ -0,0 +1,98 @@
+import numpy as np
+
+from libs.decode import StreamDecoder
+from libs.utils import RateMeter, metrics
+from libs.timebase import SampleClock
+
+
+class SampleIngestor(object):
+	""" Turns the (data, timestamp) chunks delivered by a
+		ComMonitorThread into timestamped samples.
+
+		All chunks taken from the queue in one go are decoded as
+		one batch with a StreamDecoder, either as list of chunks
+		with ingest() or already joined, as ChunkQueue.drain()
+		returns them, with ingest_data().
+
+		sample_rate:
+			Sample rate the device was configured with (the s:
+			parameter of the conf command) in Hz.
+
+		mode:
+			'full' returns every decoded sample, timed by a
+			SampleClock from the running sample count and the
+			chunk timestamps, which follows the drift of the device
+			clock.
+			'mean' averages all samples of a batch into a single
+			value stamped with the timestamp of the last chunk
+			(decimation to the polling rate).
+
+		rate_in/rate_out:
+			Decoded and returned samples per second.
+
+		lost_samples:
+			Samples discarded by the data queue before decoding
+			(two bytes per sample).
+	"""
+	def __init__(self, sample_rate=10000., mode='full'):
+		if mode not in ('full', 'mean'):
+			raise ValueError('unknown ingest mode %r' % mode)
+		self.sample_rate = float(sample_rate)
+		self.mode = mode
+		self.decoder = StreamDecoder()
+		self.meter_in = RateMeter()
+		self.meter_out = RateMeter()
+		self.clock = SampleClock(sample_rate)
+		self.lost_samples = 0
+		self.timer = metrics.histogram('decode')
+		self.sample_counter = metrics.counter('decode.samples')
+
+	@property
+	def rate_in(self):
+		return self.meter_in.rate
+
+	@property
+	def rate_out(self):
+		return self.meter_out.rate
+
+	def ingest(self, qdata):
+		""" Decode a list of (data, timestamp) chunks. Returns the
+			arrays (timestamps, samples), or None if the chunks did
+			not complete any sample.
+		"""
+		return self.ingest_data(b''.join([item[0] for item in qdata]), qdata[-1][1] if qdata else None)
+
+	def ingest_data(self, data, tstamp, lost_bytes=0):
+		""" Decode the joined data of a batch of chunks, the last of
+			which arrived at tstamp. lost_bytes were discarded before
+			the batch (see ChunkQueue.drain()), the sample clock
+			skips their samples.
+		"""
+		if lost_bytes:
+			self.clock.skip(lost_bytes//2)
+			self.lost_samples += lost_bytes//2
+		with self.timer.time():
+			samples = self.decoder.decode(data)
+		n = len(samples)
+		self.sample_counter.add(n)
+		self.meter_in.add(n)
+		if n==0:
+			self.meter_out.add(0)
+			return None
+
+		if self.mode=='full':
+			timestamps = self.clock.stamp(n, tstamp)
+			samples = samples.astype(float)
+		else:
+			timestamps = np.array([tstamp])
+			samples = np.array([np.mean(samples)])
+
+		self.meter_out.add(len(samples))
+		return timestamps, samples
+
+	def status(self):
+		""" Short summary of rates and link quality """
+		return '%.0f samples/s decoded, %.0f samples/s %s, %d sync losses, %d corrupted frames, drift %+.0f ppm, %d gaps' % (
+			self.rate_in, self.rate_out, self.mode,
+			self.decoder.sync_losses, self.decoder.corrupted_frames, self.clock.drift*1e6,
+			self.clock.gaps)
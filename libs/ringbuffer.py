@@ -0,0 +1,129 @@
+import ctypes
+import multiprocessing
+
+import numpy as np
+
+
+class RingBuffer(object):
+	""" Fixed capacity buffer of (time, value) samples backed by
+		preallocated numpy arrays.
+
+		Every sample is stored twice, at position i and i+capacity,
+		so the most recent samples always form one contiguous slice
+		and can be returned as views without copying. Appending n
+		samples costs O(n), independent of the capacity.
+
+		The views returned by latest() and since() are only valid
+		until the next call to extend(), which may overwrite them.
+
+		count:
+			Total number of samples appended since the last clear(),
+			including the ones already overwritten.
+
+		channels:
+			If given, every sample time holds one value per channel
+			and values are arrays of shape (channels, n), one row
+			per channel, sharing the times.
+	"""
+	def __init__(self, capacity, dtype=float, channels=None):
+		self.capacity = int(capacity)
+		self.channels = channels
+		shape = (2*self.capacity,) if channels is None else (channels, 2*self.capacity)
+		self._time = np.zeros(2*self.capacity)
+		self._value = np.zeros(shape, dtype=dtype)
+		self.clear()
+
+	def clear(self):
+		self.count = 0
+
+	def __len__(self):
+		return min(self.count, self.capacity)
+
+	def append(self, time, value):
+		self.extend([time], [value])
+
+	def extend(self, times, values):
+		""" Append the samples (times, values). The data is written
+			before count is increased, so a reader that takes count
+			first only sees complete samples.
+		"""
+		n = len(times)
+		cap = self.capacity
+		m = min(n, cap)
+		times, values = np.asarray(times)[n-m:], np.asarray(values)[..., n-m:]
+
+		## write up to the end of the first copy, wrap the rest around
+		end = (self.count + n - m) % cap
+		k = min(m, cap - end)
+		for column, data in ((self._time, times), (self._value, values)):
+			column[..., end:end+k] = column[..., cap+end:cap+end+k] = data[..., :k]
+			column[..., :m-k] = column[..., cap:cap+m-k] = data[..., k:]
+		self.count += n
+
+	def between(self, start, stop):
+		""" Views (times, values) of the samples number start to
+			stop-1, counted since the last clear(), as far as they
+			were not yet overwritten. stop must not exceed count.
+		"""
+		start = max(start, stop - self.capacity, 0)
+		end = stop % self.capacity + self.capacity
+		n = max(0, stop - start)
+		return self._time[end-n:end], self._value[..., end-n:end]
+
+	def latest(self, n=None):
+		""" Views (times, values) of the n most recent samples, or
+			of all samples in the buffer if n is None.
+		"""
+		count = self.count
+		if n is None:
+			n = self.capacity
+		return self.between(count - n, count)
+
+	def since(self, count):
+		""" Views (times, values) of the samples appended after
+			the buffer held 'count' samples in total, as far as
+			they were not yet overwritten.
+		"""
+		return self.between(count, self.count)
+
+
+class SharedRingBuffer(RingBuffer):
+	""" RingBuffer of float samples in shared memory, written by one
+		process and read by others without copying.
+
+		The arrays and the sample count live in multiprocessing
+		RawArrays/RawValue; the buffer may be passed to a child
+		process as a Process argument and maps the same memory
+		there. There is no lock: the single writer stores the data
+		before it increases count, readers take count first and
+		only access samples below it (see between()). A reader
+		must be done with its views before the writer has appended
+		another capacity - n samples; SharedSampleReader checks
+		this after copying.
+	"""
+	def __init__(self, capacity):
+		self.capacity = int(capacity)
+		self._shared = (multiprocessing.RawArray(ctypes.c_double, 2*self.capacity),
+			multiprocessing.RawArray(ctypes.c_double, 2*self.capacity),
+			multiprocessing.RawValue(ctypes.c_longlong, 0))
+		self._attach()
+
+	def _attach(self):
+		time, value, self._count = self._shared
+		self._time = np.frombuffer(time, dtype=float)
+		self._value = np.frombuffer(value, dtype=float)
+
+	@property
+	def count(self):
+		return self._count.value
+
+	@count.setter
+	def count(self, count):
+		self._count.value = count
+
+	def __getstate__(self):
+		return dict(capacity=self.capacity, _shared=self._shared)
+
+	def __setstate__(self, state):
+		self.__dict__.update(state)
+		self._attach()
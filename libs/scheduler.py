@@ -0,0 +1,106 @@
+import time
+
+from libs.utils import RateMeter, metrics
+
+
+class RenderScheduler(object):
+	""" Decides which panes of a window to draw, so that each pane
+		refreshes at its own rate and only ever shows the newest
+		snapshot.
+
+		The window polls due(version) at least as often as the
+		fastest pane, where 'version' counts the snapshots
+		published so far (LiveDataFeed.version). A pane is due when
+		its period has passed and a snapshot newer than the one it
+		shows exists. A pane that fell behind by more than a period
+		is not made to catch up: its missed frames are counted as
+		late and its next frame is scheduled a period from now.
+		Frames are only missed while a newer snapshot waits: a pane
+		with nothing new to draw when its frame is due waits for
+		the next snapshot from the time of the poll.
+		Snapshots replaced before any pane drew them are counted as
+		dropped.
+
+		rates:
+			Dict of pane name to target frames per second.
+
+		fps(pane):
+			Achieved frames per second of a pane.
+
+		dropped/late:
+			Counters of dropped snapshots and of missed frames.
+			Also recorded as render.dropped and render.late in the
+			metrics registry, the frame rates as gauges
+			render.fps.<pane>.
+	"""
+	def __init__(self, rates, clock=time.time):
+		self.rates = dict(rates)
+		self.clock = clock
+		self.meters = dict((pane, RateMeter()) for pane in rates)
+		self.dropped = 0
+		self.late = 0
+		self.dropped_counter = metrics.counter('render.dropped')
+		self.late_counter = metrics.counter('render.late')
+		self.fps_gauges = dict((pane, metrics.gauge('render.fps.' + pane)) for pane in rates)
+		self.reset()
+
+	def reset(self):
+		now = self.clock()
+		self.next_frame = dict((pane, now) for pane in self.rates)
+		self.shown = dict((pane, 0) for pane in self.rates)
+		self.version = 0
+		self.drawn_version = 0
+		self.decided = 0
+
+	def set_rate(self, pane, rate):
+		self.rates[pane] = rate
+
+	def fps(self, pane):
+		return self.meters[pane].rate
+
+	def due(self, version):
+		""" The panes to draw now, given the number of snapshots
+			published so far. Call drawn() once they are drawn.
+		"""
+		if version>self.version:
+			## snapshots up to the one before the newest can no
+			## longer be drawn, count those no pane has drawn
+			lost = version - 1 - self.decided
+			if self.drawn_version>self.decided:
+				lost -= 1
+			if lost>0:
+				self.dropped += lost
+				self.dropped_counter.add(lost)
+			self.decided = version - 1
+			self.version = version
+		now = self.clock()
+		panes = []
+		for pane, rate in self.rates.items():
+			if now<self.next_frame[pane]:
+				continue
+			if self.shown[pane]>=version:
+				self.next_frame[pane] = now
+				continue
+			period = 1./rate
+			missed = int((now - self.next_frame[pane])/period + 1e-9)
+			if missed>0:
+				self.late += missed
+				self.late_counter.add(missed)
+				self.next_frame[pane] = now + period
+			else:
+				self.next_frame[pane] += period
+			panes.append(pane)
+		return panes
+
+	def drawn(self, panes):
+		""" Record that 'panes' now show the newest snapshot """
+		for pane in panes:
+			self.shown[pane] = self.version
+			self.meters[pane].add()
+			self.fps_gauges[pane].set(self.meters[pane].rate)
+		if panes:
+			self.drawn_version = self.version
+
+	def status(self):
+		return ', '.join('%s %.1f fps' % (pane, self.fps(pane)) for pane in sorted(self.rates)) + \
+			', %d dropped, %d late' % (self.dropped, self.late)
@@ -0,0 +1,200 @@
+import errno
+import json
+import os
+
+import numpy as np
+
+from libs.decode import StreamDecoder
+from libs.timebase import SampleClock
+
+
+## one index record per chunk: timestamp of its last byte/sample
+## and the data offset just past it
+index_dtype = np.dtype([('timestamp', '<f8'), ('end', '<i8')])
+data_dtypes = {'raw': np.dtype('u1'), 'samples': np.dtype('<u2')}
+data_suffixes = {'raw': '.raw', 'samples': '.u16'}
+
+
+class SessionWriter(object):
+	""" Append-only recording of the data of one headset.
+
+		A session consists of three files sharing the prefix 'path':
+		the data (path.raw with the bytes as received, or path.u16
+		with the decoded samples as little endian uint16), the index
+		path.idx with one (timestamp, end) record per chunk, and
+		path.json with the settings of the session. Data and index
+		are only ever appended, and the data of a chunk is flushed
+		before its index record is written, so a session can be
+		read while it is recorded and a crash loses at most the
+		unflushed chunks.
+
+		kind:
+			'raw' records the serial chunks (write_chunks), 'samples'
+			the decoded samples (write_samples).
+
+		A session is only ever written by one writer: if files with
+		the prefix exist, OSError (EEXIST) is raised instead of
+		appending chunks whose index would not match the data.
+	"""
+	def __init__(self, path, kind='raw', sample_rate=10000., **meta):
+		if kind not in data_dtypes:
+			raise ValueError('unknown session kind %r' % kind)
+		self.path = path
+		self.kind = kind
+		self.offset = 0
+		self.chunks = 0
+		meta.update(kind=kind, sample_rate=sample_rate)
+		for suffix in ('.json', '.idx') + tuple(data_suffixes.values()):
+			if os.path.exists(path + suffix):
+				raise OSError(errno.EEXIST, 'session exists', path + suffix)
+		self._data = self._create(path + data_suffixes[kind])
+		self._index = self._create(path + '.idx')
+		with open(path + '.json', 'w') as f:
+			json.dump(meta, f)
+
+	@staticmethod
+	def _create(filename):
+		""" Open a new file for appending, failing if it exists """
+		fd = os.open(filename, os.O_WRONLY | os.O_CREAT | os.O_EXCL | getattr(os, 'O_BINARY', 0))
+		return os.fdopen(fd, 'ab')
+
+	def _append(self, data, n, timestamp):
+		self._data.write(data)
+		self._data.flush()
+		self.offset += n
+		self._index.write(np.array([(timestamp, self.offset)], dtype=index_dtype).tobytes())
+		self.chunks += 1
+
+	def write_chunks(self, qdata):
+		""" Record a list of (data, timestamp) chunks as received """
+		for data, timestamp in qdata:
+			if len(data):
+				self._append(data, len(data), timestamp)
+
+	def write_batch(self, data, ends, timestamps):
+		""" Record chunks joined into one string, as returned by
+			ChunkQueue.drain() ('raw' sessions): 'ends' are the
+			offsets in data at which the chunks end
+		"""
+		keep = np.diff(np.r_[0, ends])>0
+		if not np.any(keep):
+			return
+		self._data.write(data)
+		self._data.flush()
+		index = np.empty(np.count_nonzero(keep), dtype=index_dtype)
+		index['timestamp'] = timestamps[keep]
+		index['end'] = self.offset + ends[keep]
+		self._index.write(index.tobytes())
+		self.offset += len(data)
+		self.chunks += len(index)
+
+	def write_samples(self, timestamps, samples):
+		""" Record a block of decoded samples, stamped with the time
+			of its last sample
+		"""
+		if len(samples):
+			data = np.asarray(samples, dtype=data_dtypes['samples']).tobytes()
+			self._append(data, len(samples), timestamps[-1])
+
+	def flush(self):
+		self._data.flush()
+		self._index.flush()
+
+	def close(self):
+		self._data.close()
+		self._index.close()
+
+
+class SessionReader(object):
+	""" Reads a session written by SessionWriter.
+
+		Data and index are memory mapped, nothing is loaded until
+		it is accessed; a time range is located by binary search in
+		the index. Reopen the reader to see data appended after it
+		was opened; of a session being recorded, only the chunks
+		whose data is complete are read.
+
+		index:
+			Structured array of the chunk records (timestamp, end).
+
+		data:
+			The recorded bytes or samples.
+	"""
+	def __init__(self, path):
+		self.path = path
+		with open(path + '.json') as f:
+			self.meta = json.load(f)
+		self.kind = self.meta['kind']
+		self.sample_rate = self.meta['sample_rate']
+		self.index = self._map(path + '.idx', index_dtype)
+		self.data = self._map(path + data_suffixes[self.kind], data_dtypes[self.kind])
+		## the index may be ahead of the data while recording
+		self.nchunks = int(np.searchsorted(self.index['end'], len(self.data), 'right'))
+
+	@staticmethod
+	def _map(filename, dtype):
+		n = os.path.getsize(filename)//dtype.itemsize
+		if n==0:
+			return np.zeros(0, dtype=dtype)
+		return np.memmap(filename, dtype=dtype, mode='r', shape=(n,))
+
+	def __len__(self):
+		return self.nchunks
+
+	@property
+	def duration(self):
+		if self.nchunks==0:
+			return 0.
+		return self.index['timestamp'][self.nchunks-1] - self.index['timestamp'][0]
+
+	def chunk_range(self, t_start=None, t_stop=None):
+		""" Indices (first, stop) of the chunks with timestamps in
+			[t_start, t_stop)
+		"""
+		timestamps = self.index['timestamp'][:self.nchunks]
+		first = 0 if t_start is None else int(np.searchsorted(timestamps, t_start, 'left'))
+		stop = self.nchunks if t_stop is None else int(np.searchsorted(timestamps, t_stop, 'left'))
+		return first, max(first, stop)
+
+	def _bounds(self, i):
+		start = self.index['end'][i-1] if i>0 else 0
+		return start, self.index['end'][i]
+
+	def iter_chunks(self, t_start=None, t_stop=None):
+		""" Yields the recorded (data, timestamp) chunks in the time
+			range, data as bytes (raw) or uint16 array (samples)
+		"""
+		first, stop = self.chunk_range(t_start, t_stop)
+		for i in range(first, stop):
+			start, end = self._bounds(i)
+			data = self.data[start:end]
+			yield (data.tobytes() if self.kind=='raw' else data), self.index['timestamp'][i]
+
+	def read_samples(self, t_start=None, t_stop=None):
+		""" Arrays (timestamps, samples) of the chunks in the time
+			range. The samples are timed by a SampleClock from their
+			count and the chunk timestamps, drift corrected and
+			monotonic as SampleIngestor times them, the clock
+			starting at the first chunk of the range. Raw sessions
+			are decoded, partial frames at the start of the range are
+			skipped.
+		"""
+		first, stop = self.chunk_range(t_start, t_stop)
+		if stop==first:
+			return np.zeros(0), np.zeros(0, dtype=np.uint16)
+		timestamps = np.asarray(self.index['timestamp'][first:stop])
+		bounds = np.asarray(self.index['end'][max(0, first - 1):stop])
+		if first==0:
+			bounds = np.r_[0, bounds]
+		if self.kind=='raw':
+			decoder = StreamDecoder()
+			blocks = [decoder.decode(self.data[a:b].tobytes()) for a, b in zip(bounds[:-1], bounds[1:])]
+			counts = np.array([len(block) for block in blocks])
+			samples = np.concatenate(blocks)
+		else:
+			counts = np.diff(bounds)
+			samples = np.array(self.data[bounds[0]:bounds[-1]])
+
+		clock = SampleClock(self.sample_rate)
+		times = np.concatenate([clock.stamp(n, timestamp) for n, timestamp in zip(counts, timestamps)])
+		return times, samples
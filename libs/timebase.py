@@ -0,0 +1,190 @@
+import ctypes
+import ctypes.util
+import sys
+import time
+
+import numpy as np
+
+from libs.ringbuffer import RingBuffer
+
+
+def _posix_monotonic():
+	""" clock_gettime(CLOCK_MONOTONIC) for Pythons without
+		time.monotonic, None where it is not available
+	"""
+	if not sys.platform.startswith('linux'):
+		return None
+	class timespec(ctypes.Structure):
+		_fields_ = [('tv_sec', ctypes.c_long), ('tv_nsec', ctypes.c_long)]
+	try:
+		librt = ctypes.CDLL(ctypes.util.find_library('rt') or ctypes.util.find_library('c'))
+		clock_gettime = librt.clock_gettime
+	except (OSError, AttributeError):
+		return None
+	clock_gettime.argtypes = [ctypes.c_int, ctypes.POINTER(timespec)]
+	CLOCK_MONOTONIC = 1
+	def monotonic():
+		ts = timespec()
+		clock_gettime(CLOCK_MONOTONIC, ctypes.byref(ts))
+		return ts.tv_sec + ts.tv_nsec*1e-9
+	return monotonic
+
+## Time stamps of received data, in s. Monotonic and system wide, so
+## stamps taken in an AcquisitionProcess compare with those of the
+## GUI process; wall time where no monotonic clock is available.
+monotonic = getattr(time, 'monotonic', None) or _posix_monotonic() or time.time
+
+
+class SampleClock(object):
+	""" Times of the samples of a device derived from their running
+		count, corrected for the drift between device and host
+		clock.
+
+		The device samples at its own crystal's idea of the nominal
+		rate, the host only sees when chunks arrive, late by a
+		varying transport delay. Every chunk adds an observation
+		(samples so far, arrival time); over the last 'window'
+		observations a line is fitted through the least delayed
+		arrival of each of 'segments' parts of the window; its
+		slope is the sample period in host seconds, and it is
+		shifted down to the earliest arrival. Sample times
+		continue from the last stamped sample with the fitted
+		period, slewed towards the line by at most 'max_slew'
+		(relative) per sample, so times never jump or run
+		backwards and samples that were stamped stay as they are.
+
+		Samples lost on the link leave the count behind: every
+		later chunk then arrives late by the lost time. When the
+		last samples of 'confirm' chunks in a row, arriving over at
+		least the gap threshold, came more than the threshold after
+		the line, the line and the sample times are re-anchored to
+		the arrivals, and the gap is counted in 'gaps'. The
+		threshold is 'gap_chunks' mean chunk durations, at least
+		'min_gap' seconds. The backlog of a stall is late only
+		until it is read, within a fraction of that time, and does
+		not trigger it. Losses known to the caller are passed to
+		skip() instead.
+
+		sample_rate:
+			Nominal rate of the device (the s: parameter), the
+			first estimate of the rate. Fitted periods more than
+			'tolerance' away from it are not trusted.
+
+		drift:
+			Relative deviation of the device rate from the nominal
+			rate as seen by the host, e.g. 1e-4 when the device
+			clock runs 100 ppm slow.
+
+		offset:
+			Time of the last stamped sample minus the fitted line,
+			the error that is still being slewed away.
+	"""
+	def __init__(self, sample_rate, window=500, max_slew=1e-3, tolerance=0.05, segments=8,
+			refit=10, gap_chunks=4, min_gap=0.05, confirm=3):
+		self.nominal_period = 1./sample_rate
+		self.segments = segments
+		self.refit = refit
+		self.max_slew = max_slew
+		self.tolerance = tolerance
+		self.gap_chunks = gap_chunks
+		self.min_gap = min_gap
+		self.confirm = confirm
+		self.observations = RingBuffer(window)
+		self.reset()
+
+	def reset(self):
+		self.observations.clear()
+		self.period = self.nominal_period
+		self.intercept = None
+		self.count = 0
+		self.last_time = None
+		self.unfitted = 0
+		self.chunks = 0
+		self.behind = 0
+		self.behind_since = None
+		self.gaps = 0
+
+	@property
+	def drift(self):
+		return self.period/self.nominal_period - 1.
+
+	@property
+	def offset(self):
+		if self.last_time is None:
+			return 0.
+		return self.last_time - (self.intercept + (self.count - 1)*self.period)
+
+	def _fit(self):
+		counts, arrivals = self.observations.latest()
+		if len(counts)>=2*self.segments:
+			## the least delayed arrival of every segment of the
+			## window, immune to stalls that delay whole runs
+			## of chunks
+			m = len(counts)//self.segments*self.segments
+			counts, arrivals = counts[-m:], arrivals[-m:]
+			residuals = (arrivals - counts*self.nominal_period).reshape(self.segments, -1)
+			picks = np.argmin(residuals, axis=1) + np.arange(0, m, m//self.segments)
+			## centred for a well conditioned fit
+			c = counts[picks] - counts[picks].mean()
+			t = arrivals[picks] - arrivals[picks].mean()
+			period = np.dot(c, t)/np.dot(c, c)
+			if abs(period/self.nominal_period - 1.)<=self.tolerance:
+				self.period = period
+		counts, arrivals = self.observations.latest()
+		self.intercept = np.min(arrivals - counts*self.period)
+
+	def skip(self, n):
+		""" Account for n samples known to be lost """
+		self.count += n
+		if self.last_time is not None:
+			self.last_time += n*self.period
+
+	def _check_gap(self, n, arrival):
+		""" Re-anchor after 'confirm' chunks in a row arrived too
+			late for the count, i.e. samples were lost
+		"""
+		residual = arrival - (self.intercept + (self.count + n - 1)*self.period)
+		chunk_duration = self.count/float(max(1, self.chunks))*self.period
+		threshold = max(self.min_gap, self.gap_chunks*chunk_duration)
+		if residual<=threshold:
+			self.behind = 0
+			return
+		if self.behind==0:
+			self.behind_since = arrival
+		self.behind += 1
+		if self.behind>=self.confirm and arrival - self.behind_since>=threshold:
+			self.observations.clear()
+			self.intercept = None
+			self.last_time = None
+			self.behind = 0
+			self.gaps += 1
+
+	def stamp(self, n, arrival):
+		""" Times of the next n samples, the last of which arrived
+			at host time 'arrival' (monotonic())
+		"""
+		if n==0:
+			return np.zeros(0)
+		if self.intercept is not None:
+			self._check_gap(n, arrival)
+		self.chunks += 1
+		self.observations.append(self.count + n - 1, arrival)
+		## the period changes slowly, refit it now and then and
+		## in between only lower the line to new early arrivals
+		self.unfitted += 1
+		if self.intercept is None or self.unfitted>=self.refit:
+			self._fit()
+			self.unfitted = 0
+		else:
+			self.intercept = min(self.intercept, arrival - (self.count + n - 1)*self.period)
+		k = np.arange(1, n + 1)
+		if self.last_time is None:
+			times = self.intercept + (self.count - 1 + k)*self.period
+		else:
+			target = self.intercept + (self.count + n - 1)*self.period
+			error = target - (self.last_time + n*self.period)
+			slew = np.clip(error/n, -self.max_slew*self.period, self.max_slew*self.period)
+			times = self.last_time + k*(self.period + slew)
+		self.count += n
+		self.last_time = times[-1]
+		return times
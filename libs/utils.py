@@ -1,18 +1,259 @@
 from __future__ import print_function
-import random, time
+import json, random, threading, time
 import Queue
 
+from libs.timebase import monotonic
+
 class Timer(object):
-    def __init__(self, name=None):
+    """ Measures the elapsed time of a with block, on the monotonic
+        clock so that adjustments of the system clock do not distort
+        it. The elapsed time is printed, prefixed with 'name', or
+        recorded into 'histogram' if one is given (see
+        MetricsRegistry.timer).
+    """
+    def __init__(self, name=None, histogram=None):
         self.name = name
+        self.histogram = histogram
+        self.elapsed = 0.
     
     def __enter__(self):
-        self.tstart = time.time()
+        self.tstart = monotonic()
+        return self
         
     def __exit__(self, type, value, traceback):
+        self.elapsed = monotonic() - self.tstart
+        if self.histogram is not None:
+            self.histogram.record(self.elapsed)
+            return
         if self.name:
             print('[%s]' % self.name, end=' ')
-        print('Elapsed: %s' % (time.time() - self.tstart))
+        print('Elapsed: %s' % self.elapsed)
+
+
+class Counter(object):
+    """ Monotonic event counter """
+    def __init__(self):
+        self.value = 0
+        self.lock = threading.Lock()
+
+    def add(self, n=1):
+        with self.lock:
+            self.value += n
+
+
+class Gauge(object):
+    """ Most recent value of a quantity, e.g. a queue length """
+    def __init__(self):
+        self.value = 0.
+
+    def set(self, value):
+        self.value = value
+
+
+class Histogram(object):
+    """ Latency histogram with HDR-style log-linear buckets.
+    
+        Values are counted in multiples of 'unit' (1 us by default)
+        in buckets whose width grows with the power of two of the
+        value, which keeps the relative error below
+        2**-(sub_bits - 1) (1.6% by default) from microseconds to
+        hours in a few thousand buckets. Recording is O(1).
+    """
+    def __init__(self, unit=1e-6, sub_bits=7, max_exponent=40):
+        self.unit = unit
+        self.sub_bits = sub_bits
+        self.nbuckets = (max_exponent + 1) << sub_bits
+        self.lock = threading.Lock()
+        self.reset()
+
+    def reset(self):
+        with self.lock:
+            self.counts = [0]*self.nbuckets
+            self.count = 0
+            self.total = 0.
+            self.min = float('inf')
+            self.max = 0.
+
+    def _index(self, v):
+        exponent = max(0, v.bit_length() - self.sub_bits)
+        return min(self.nbuckets - 1, (exponent << self.sub_bits) + (v >> exponent))
+
+    def _value(self, index):
+        """ middle of the bucket """
+        exponent, mantissa = index >> self.sub_bits, index & ((1 << self.sub_bits) - 1)
+        return ((mantissa << exponent) + (1 << exponent)//2)*self.unit
+
+    def record(self, value):
+        index = self._index(max(0, int(value/self.unit)))
+        with self.lock:
+            self.counts[index] += 1
+            self.count += 1
+            self.total += value
+            if value<self.min:
+                self.min = value
+            if value>self.max:
+                self.max = value
+
+    def time(self):
+        """ Timer recording the duration of a with block """
+        return Timer(histogram=self)
+
+    @property
+    def mean(self):
+        return self.total/self.count if self.count else 0.
+
+    def percentiles(self, ps):
+        """ Values below which the percentages ps of the recorded
+            values lie, within the precision of the buckets
+        """
+        with self.lock:
+            counts, count, vmax = list(self.counts), self.count, self.max
+        if count==0:
+            return [0. for p in ps]
+        ranks = [max(1, int(round(p/100.*count))) for p in ps]
+        result = [None]*len(ps)
+        order = sorted(range(len(ps)), key=lambda i: ranks[i])
+        cumulative, k = 0, 0
+        for index, n in enumerate(counts):
+            cumulative += n
+            while k<len(order) and cumulative>=ranks[order[k]]:
+                result[order[k]] = min(self._value(index), vmax)
+                k += 1
+            if k==len(order):
+                break
+        return result
+
+    def percentile(self, p):
+        return self.percentiles([p])[0]
+
+    def summary(self):
+        p50, p90, p99, p999 = self.percentiles([50, 90, 99, 99.9])
+        return dict(count=self.count, mean=self.mean, p50=p50, p90=p90, p99=p99,
+            p999=p999, max=self.max)
+
+
+class MetricsRegistry(object):
+    """ Named counters, gauges and histograms.
+    
+        counter(name), gauge(name) and histogram(name) return the
+        metric of that name, created on first use. Components look
+        their metrics up once and keep them, so recording costs a
+        lock and a few arithmetic operations. Names are dotted
+        paths of the pipeline stage, e.g. 'dsp.filter'.
+    """
+    def __init__(self):
+        self.counters = {}
+        self.gauges = {}
+        self.histograms = {}
+        self.lock = threading.Lock()
+
+    def _get(self, table, name, factory):
+        try:
+            return table[name]
+        except KeyError:
+            with self.lock:
+                return table.setdefault(name, factory())
+
+    def counter(self, name):
+        return self._get(self.counters, name, Counter)
+
+    def gauge(self, name):
+        return self._get(self.gauges, name, Gauge)
+
+    def histogram(self, name):
+        return self._get(self.histograms, name, Histogram)
+
+    def timer(self, name):
+        """ Timer recording into histogram 'name' """
+        return Timer(histogram=self.histogram(name))
+
+    def snapshot(self):
+        """ Dict of the current values, histograms summarized """
+        return dict(
+            counters=dict((name, c.value) for name, c in self.counters.items()),
+            gauges=dict((name, g.value) for name, g in self.gauges.items()),
+            histograms=dict((name, h.summary()) for name, h in self.histograms.items()))
+
+    def reset(self):
+        """ Empty the histograms, counters keep counting """
+        for histogram in list(self.histograms.values()):
+            histogram.reset()
+
+    def report(self):
+        """ Text table of all metrics, latencies in ms """
+        lines = ['%-24s %8s %8s %8s %8s %8s %8s' % ('latency [ms]', 'count',
+            'mean', 'p50', 'p99', 'p99.9', 'max')]
+        for name in sorted(self.histograms):
+            h = self.histograms[name].summary()
+            lines.append('%-24s %8d %8.3f %8.3f %8.3f %8.3f %8.3f' % (name, h['count'],
+                h['mean']*1e3, h['p50']*1e3, h['p99']*1e3, h['p999']*1e3, h['max']*1e3))
+        for name in sorted(self.counters):
+            lines.append('%-24s %12d' % (name, self.counters[name].value))
+        for name in sorted(self.gauges):
+            lines.append('%-24s %12.6g' % (name, self.gauges[name].value))
+        return '\n'.join(lines)
+
+
+## registry of the pipeline stages
+metrics = MetricsRegistry()
+
+
+class MetricsDumper(threading.Thread):
+    """ Writes a JSON line with a snapshot of 'registry' to the file
+        object 'out' every 'interval' seconds. With reset=True the
+        histograms are emptied after each dump, so every line shows
+        the latencies of its own interval.
+    """
+    def __init__(self, out, interval=10., registry=None, reset=True):
+        threading.Thread.__init__(self)
+        self.daemon = True
+        self.out = out
+        self.interval = interval
+        self.registry = registry if registry is not None else metrics
+        self.reset = reset
+        self.alive = threading.Event()
+        self.alive.set()
+
+    def dump(self):
+        snapshot = self.registry.snapshot()
+        snapshot['time'] = time.time()
+        if self.reset:
+            self.registry.reset()
+        self.out.write(json.dumps(snapshot) + '\n')
+        self.out.flush()
+
+    def run(self):
+        next_dump = time.time() + self.interval
+        while self.alive.isSet():
+            time.sleep(min(0.1, max(0, next_dump - time.time())))
+            if time.time()>=next_dump:
+                next_dump += self.interval
+                self.dump()
+        self.dump()
+
+    def join(self, timeout=None):
+        self.alive.clear()
+        threading.Thread.join(self, timeout)
+
+
+class RateMeter(object):
+    """ Measures the rate of events per second of wall time, e.g.
+        samples per second. The rate is updated once every
+        'interval' seconds.
+    """
+    def __init__(self, interval=1.):
+        self.interval = interval
+        self.rate = 0.
+        self.count = 0
+        self.tstart = monotonic()
+
+    def add(self, n=1):
+        self.count += n
+        elapsed = monotonic() - self.tstart
+        if elapsed >= self.interval:
+            self.rate = self.count / elapsed
+            self.count = 0
+            self.tstart += elapsed
 
 
 def get_all_from_queue(Q):
@@ -23,7 +264,7 @@ def get_all_from_queue(Q):
         while True:
             yield Q.get_nowait( )
     except Queue.Empty:
-        raise StopIteration
+        return
 
 
 def get_item_from_queue(Q, timeout=0.01):
@@ -1,3 +1,8 @@
+import numpy as np
+
+from libs.ringbuffer import RingBuffer
+
+
 class LiveDataFeed(object):
 	""" A simple "live data feed" abstraction that allows a reader 
 		to read the most recent data and find out whether it was 
@@ -16,15 +21,27 @@ class LiveDataFeed(object):
 		has_new_data:
 			A boolean attribute telling the reader whether the
 			data was updated since the last read.    
+		
+		version:
+			Number of times data was added, to tell how many
+			updates the reader missed.
+		
+		append_data(data) keeps the most recent 'capacity' 
+		(timestamp, temperature) samples in a RingBuffer, 
+		read_arrays() returns views of them and read_new() the
+		samples appended since its last call.
 	"""
-	def __init__(self):
+	def __init__(self, capacity=1000):
 		self.cur_data = None
 		self.has_new_data = False
-		self.list_data = []
+		self.version = 0
+		self.ring = RingBuffer(capacity)
 		self.updated_list = False
+		self.read_count = 0
 	
 	def add_data(self, data):
 		self.cur_data = data
+		self.version += 1
 		self.has_new_data = True
 	
 	def read_data(self):
@@ -32,15 +49,35 @@ class LiveDataFeed(object):
 		return self.cur_data
 	   
 	def append_data(self, data):
-		self.list_data.append((data['timestamp'], data['temperature']))
-		if len(self.list_data)>1000:
-			#self.list_data = self.list_data[-1000:]
-			self.list_data.pop(0)
+		""" data['timestamp'] and data['temperature'] are either
+			single values or arrays of the same length
+		"""
+		if np.ndim(data['timestamp']):
+			self.ring.extend(data['timestamp'], data['temperature'])
+		else:
+			self.ring.append(data['timestamp'], data['temperature'])
 		self.updated_list = True
 		
-	def read_list(self):
+	def read_arrays(self, n=None):
+		""" Returns views (timestamps, temperatures) of the n most 
+			recent samples, or of all stored samples.
+		"""
+		self.updated_list = False
+		return self.ring.latest(n)
+	
+	def read_new(self):
+		""" Returns views (timestamps, temperatures) of the samples
+			appended since the last call.
+		"""
+		self.updated_list = False
+		new = self.ring.since(self.read_count)
+		self.read_count = self.ring.count
+		return new
+	
+	def clear(self):
+		self.ring.clear()
 		self.updated_list = False
-		return self.list_data
+		self.read_count = 0
 
 
 if __name__ == "__main__":
@@ -0,0 +1,554 @@
+"""
+A simple demonstration of a serial port monitor that plots live
+data using pyqtgraph.
+The monitor expects to receive 8-byte data packets on the
+serial port. The packages are decoded such that the first byte
+contains the 3 most significant bits and the second byte contains
+the 7 least significat bits.
+
+Any number of headsets can play, each player pushing the ball
+towards one of the two goals:
+
+	python plotting_data_monitor.py /dev/ttyACM0 /dev/ttyACM1 ...
+
+Players alternate between the left and the right team.
+"""
+import numpy as np
+import sys
+from PyQt4.QtCore import *
+from PyQt4.QtGui import *
+import pyqtgraph as pg
+
+import engine
+from engine import GameEngine
+from libs.utils import metrics
+from libs.timebase import monotonic
+from libs.decimate import CurveDecimator, RangeKeeper
+from libs.scheduler import RenderScheduler
+
+
+## plotting parameters
+width_signal = 5
+time_axis_range = 2 ## in s
+colors = ["#FF7D00", "#4814CC", "limegreen", "magenta", "#00B3B3", "#B30000", "#8C8C00", "#555555"]
+
+## 'full' keeps every sample sent by the device, 'mean' averages
+## all samples of a serial chunk into one
+ingest_mode = 'full'
+sample_rate = 10000. ## Hz, as configured in ComMonitorThread
+mean_rate = 100. ## Hz, nominal rate of serial chunks in 'mean' mode
+
+## rate of spectrum, arena and plot updates
+update_freq_plot = 10. ## Hz
+
+## target frame rate of each pane of the window; a pane is drawn
+## with the newest snapshot when its frame is due, snapshots that
+## arrive in between are skipped rather than queued
+pane_rates = dict(signal=10., spectrum=5., arena=10.) ## Hz
+
+## band power moving the ball: 'fft' is taken from the spectrum of
+## the signal window at every plot update, 'recursive' is updated
+## with every sample by an IIR filter estimate and moves the ball
+## after every processed block of samples
+band_power_backend = 'fft'
+
+## 'thread' reads and decodes the serial data in a thread of this
+## process, 'process' in one process per headset writing to shared
+## memory (always in 'full' ingest mode), 'multiplex' reads all
+## headsets in a single thread waiting on all ports at once,
+## 'replay' plays recorded sessions instead (the players' ports are
+## then session paths) at replay_speed times real time
+acquisition = 'thread'
+replay_speed = 1.
+
+## 'bulk' waits for up to serial_latency seconds of samples per read
+## (fewer wakeups), 'legacy' returns whatever arrived after each byte
+serial_read_mode = 'bulk'
+serial_latency = 0.02 ## s
+
+## the players' signals are aligned on a common time grid, which
+## waits at most max_skew seconds for a headset lagging behind the
+## others and then holds its last value (counted as padded samples)
+max_skew = 0.5 ## s
+
+## the data queue of every headset holds at most queue_size chunks
+## and queue_bytes bytes; when the processing falls behind, it
+## 'block's the reading thread, drops the oldest chunk
+## ('drop-oldest') or joins the queued chunks ('coalesce'), see
+## libs/chunkqueue.py
+queue_policy = 'coalesce'
+queue_size = 1000
+queue_bytes = 1<<20
+
+## if set, every run of the monitor is recorded to this directory,
+## one session per player (see libs/session.py)
+record_dir = None
+
+## if set, the latencies of the pipeline stages are appended to this
+## file every metrics_interval seconds (see libs/utils.py); they are
+## always shown by Statistics in the File menu
+metrics_file = None
+metrics_interval = 10. ## s
+
+#fixes to white background and black labels
+pg.setConfigOption('background', 'w')
+pg.setConfigOption('foreground', 'k')
+
+
+def make_players(ports):
+	""" Player settings for a list of serial ports, alternately
+		playing to the left and to the right.
+	"""
+	players = engine.make_players(ports)
+	for i, player in enumerate(players):
+		player['color'] = colors[i % len(colors)]
+	return players
+
+
+class PlottingDataMonitor(QMainWindow):
+	""" Monitor and arena of a game.
+
+		players:
+			One dict per headset with the keys 'port' (serial
+			port), 'color' (of its curves and of the goal it plays
+			towards), 'name' (shown when winning), 'side' (1 plays
+			to the right, -1 to the left) and 'offset' (subtracted
+			from the signal before filtering).
+
+		accumulate/dc_in_norm:
+			Spectrum options, see PlayersPipeline.
+
+		damping:
+			See Arena.
+
+		on_winner:
+			Called with the list of winning players after a goal.
+	"""
+	def __init__(self, players, accumulate=False, dc_in_norm=False, damping=0.3,
+			on_winner=None, arena_color="#008A0E", text_size=40,
+			signal_range=[300,600,200], fft_range=[0,0.02,0.005], parent=None):
+		super(PlottingDataMonitor, self).__init__(parent)
+		self.players = players
+		self.accumulate = accumulate
+		self.dc_in_norm = dc_in_norm
+		self.on_winner = on_winner
+		self.arena_color = arena_color
+		self.signal_range = signal_range
+		self.fft_range = fft_range
+		self.band_power_backend = band_power_backend
+
+		## acquisition, processing and ball physics run in the
+		## engine, the window only renders its snapshots
+		self.engine = GameEngine(players, acquisition, sample_rate, ingest_mode,
+			mean_rate, time_axis_range, update_freq_plot, band_power_backend,
+			serial_read_mode, serial_latency, replay_speed, record_dir,
+			accumulate=accumulate, dc_in_norm=dc_in_norm, damping=damping,
+			metrics_file=metrics_file, metrics_interval=metrics_interval, max_skew=max_skew,
+			queue_size=queue_size, queue_policy=queue_policy, queue_bytes=queue_bytes)
+		self.arena = self.engine.arena
+
+		self.monitor_active = False
+		self.timer_plot = QTimer()
+		self.scheduler = RenderScheduler(pane_rates)
+		self.snapshot = None
+		self.set_data_timer = metrics.histogram('render.set_data')
+		self.paint_timer = metrics.histogram('render.paint')
+		self.frame_counter = metrics.counter('render.frames')
+
+		self.create_menu()
+		self.create_main_frame()
+		self.create_status_bar()
+
+		## init arena stuff
+		self.text_html = '<div style="text-align: center"><span style="color: #FFF; font-size: {0}pt">Goal</span><br><span style="color: #FFF; font-size: {0}pt; text-align: center"> {{}} is winner </span></div>'.format(text_size)
+		self.show_one_item = False
+		self.winner_text = None
+
+	def create_plot(self, xlabel, ylabel, xlim, ylim):
+		""" plot with one curve per player """
+		plot = pg.PlotWidget()
+		plot.setLabel('left', ylabel)
+		plot.setLabel('bottom', xlabel)
+		plot.setXRange(xlim[0], xlim[1])
+		plot.setYRange(ylim[0], ylim[1])
+
+		#plot.setCanvasBackground(Qt.black)
+		plot.replot()
+
+		curves = []
+		for player in self.players:
+			curve = plot.plot(antialias=True)
+			#setting the pen width increases also fft width - do not use
+			curve.setPen(QPen(QColor(player['color'])))
+			curves.append(curve)
+		return plot, curves
+
+	def goal_color(self, side):
+		""" rgb of the goal the players on 'side' play towards """
+		for player in self.players:
+			if player['side']==side:
+				return QColor(player['color']).getRgb()[:3]
+		return (255,0,255) if side<0 else (0,255,0)
+
+	def create_arenaplot(self, xlabel, ylabel, xlim=[-1,1], ylim=[-1,1], curve_style=None):
+		""" create plot/arena in form of a soccer field
+		"""
+		plot = pg.PlotWidget(background=QColor(self.arena_color))
+		if curve_style is not None:
+			curve = plot.plot(symbol=curve_style,antialias=True, symbolSize=15, symbolBrush='w')
+		else:
+			curve = plot.plot(antialias=True)
+		plot.setLabel('left', ylabel)
+		plot.setLabel('bottom', xlabel)
+		plot.setXRange(xlim[0], xlim[1], 0.1)
+		plot.setYRange(ylim[0], ylim[1], 0.1)
+		plot.hideAxis('bottom')
+		plot.hideAxis('left')
+		plot.replot()
+
+		spi = pg.ScatterPlotItem(size=5, pen=pg.mkPen(None), brush=pg.mkBrush(255,255,255,255))
+		spi.addPoints([{'pos' : [0,0], 'data' : 1}])
+		plot.addItem(spi)
+
+		spi = pg.ScatterPlotItem(size=70, brush=pg.mkBrush(255,255,255,0))
+		spi.addPoints([{'pos' : [0,0], 'data' : 1, 'pen' : 'w'}])
+		plot.addItem(spi)
+
+		central_line = pg.GraphItem()
+		plot.addItem(central_line)
+		w = 0.5
+		pos = np.array([[0.,-1.],[0.,1.],[-1.,w],[-0.7,w],[-0.7,-w],
+		[-1.,-w],[1,w],[0.7,w],[0.7,-w],[1,-w], [-1,-1],[-1,1], [1,-1],[1,1],
+		[-1,0.2],[-1.1,0.2],[-1.1,-0.2],[-1,-0.2],
+		[1,0.2],[1.1,0.2],[1.1,-0.2],[1,-0.2]])
+
+		adj = np.array([[0,1], [2,3],[3,4],[4,5], [6,7],[7,8],[8,9],[10,12],[11,13],
+		[14,15],[15,16],[16,17],[18,19],[19,20],[20,21], [10,11],[12,13]])
+
+		#goal lines in the colours of the teams scoring there
+		lines = np.array([(255,255,255,255,1)]*15 + [self.goal_color(-1) + (255,4),
+			self.goal_color(1) + (255,4)],
+		dtype=[('red',np.ubyte),('green',np.ubyte),('blue',np.ubyte),('alpha',np.ubyte),('width',float)])
+		central_line.setData(pos=pos,adj=adj,pen=lines,size=0.1)
+
+		return plot, curve
+
+	def create_status_bar(self):
+		self.status_text = QLabel('Monitor idle')
+		self.statusBar().addWidget(self.status_text, 1)
+
+	def create_main_frame(self):
+		# Main frame and layout
+		#
+		self.mdi = QMdiArea()
+		#self.main_frame = QWidget()
+		#main_layout = QGridLayout()
+		#main_layout.setColumnStretch(0,1)
+
+
+		## Plot
+		##
+		self.plot, self.curves = self.create_plot('Time', 'Signal', [0,5,1], self.signal_range)
+		self.plot_fft, self.curves_fft = self.create_plot('Frequency [Hz]', 'Power', [0,40,10], self.fft_range)
+		## curves are decimated to the plot width and only set when
+		## their visible part changed
+		self.decimators = [CurveDecimator() for curve in self.curves]
+		self.decimators_fft = [CurveDecimator() for curve in self.curves_fft]
+		self.time_range = RangeKeeper()
+
+		plot_layout = QVBoxLayout()
+		plot_layout.addWidget(self.plot)
+		plot_layout.addWidget(self.plot_fft)
+
+		plot_groupbox = QGroupBox('Signal')
+		plot_groupbox.setLayout(plot_layout)
+
+		## Statistics, hidden until shown from the menu
+		##
+		self.stats_text = QPlainTextEdit()
+		self.stats_text.setReadOnly(True)
+		self.stats_text.setFont(QFont('Monospace'))
+		self.stats_timer = QTimer()
+		self.connect(self.stats_timer, SIGNAL('timeout()'), self.on_timer_stats)
+
+		### Arena
+		###
+		self.plot_arena, self.curve_arena = self.create_arenaplot(' ', 'Y', [-1,1,0.2], [-1,1,0.2], curve_style='o')
+
+		plot_layout_arena = QHBoxLayout()
+		plot_layout_arena.addWidget(self.plot_arena)
+
+		plot_groupbox_arena = QGroupBox('Arena')
+		plot_groupbox_arena.setLayout(plot_layout_arena)
+
+		## Main frame and layout
+		##
+		self.mdi.addSubWindow(plot_groupbox)
+		self.mdi.addSubWindow(plot_groupbox_arena)
+		self.stats_window = self.mdi.addSubWindow(self.stats_text)
+		self.stats_window.setWindowTitle('Statistics')
+		self.stats_window.setAttribute(Qt.WA_DeleteOnClose, False)
+		self.stats_window.hide()
+		self.setCentralWidget(self.mdi)
+		#main_layout.addWidget(plot_groupbox,0,0)
+		#main_layout.addWidget(plot_groupbox_arena,0,1,1,1)
+
+		#self.main_frame.setLayout(main_layout)
+		#self.setGeometry(30, 30, 950, 500)
+
+		#self.setCentralWidget(self.main_frame)
+
+
+	def create_menu(self):
+		self.file_menu = self.menuBar().addMenu("&File")
+
+		self.start_action = self.create_action("&Start monitor",
+			shortcut="Ctrl+M", slot=self.on_start, tip="Start the data monitor")
+		self.stop_action = self.create_action("&Stop monitor",
+			shortcut="Ctrl+T", slot=self.on_stop, tip="Stop the data monitor")
+		self.start_arena_action = self.create_action("&Start arena",
+			shortcut="Ctrl+A", slot=self.on_arena, tip="Start the arena")
+		self.tiled = self.create_action("&Tile windows",
+			shortcut="Ctrl+R", slot=self.tile_windows, tip="Tile open windows")
+		self.recursive_action = self.create_action("&Recursive band power",
+			shortcut="Ctrl+B", slot=self.on_band_power_backend,
+			tip="Move the ball with the per sample band power estimate", checkable=True)
+		self.recursive_action.setChecked(self.band_power_backend=='recursive')
+		self.stats_action = self.create_action("S&tatistics",
+			shortcut="Ctrl+I", slot=self.on_stats,
+			tip="Show the latencies of the processing stages", checkable=True)
+		exit_action = self.create_action("E&xit", slot=self.close,
+			shortcut="Ctrl+X", tip="Exit the application")
+
+		self.start_action.setEnabled(True)
+		self.stop_action.setEnabled(False)
+		self.start_arena_action.setEnabled(False)
+
+		self.add_actions(self.file_menu,
+			(   self.start_action, self.stop_action,
+				self.start_arena_action, self.tiled,
+				self.recursive_action, self.stats_action, None, exit_action))
+
+		self.help_menu = self.menuBar().addMenu("&Help")
+		about_action = self.create_action("&About",
+			shortcut='F1', slot=self.on_about,
+			tip='About the monitor')
+
+		self.add_actions(self.help_menu, (about_action,))
+
+	def set_actions_enable_state(self):
+		start_enable = not self.monitor_active
+		stop_enable = self.monitor_active
+		start_arena_enable = self.monitor_active
+
+		self.start_action.setEnabled(start_enable)
+		self.stop_action.setEnabled(stop_enable)
+		self.start_arena_action.setEnabled(start_arena_enable)
+
+	def on_about(self):
+		msg = __doc__
+		QMessageBox.about(self, "About the demo", msg.strip())
+
+
+	def on_stop(self):
+		""" Stop the monitor
+		"""
+		self.engine.stop()
+
+		self.monitor_active = False
+		self.timer_plot.stop()
+		self.set_actions_enable_state()
+
+		self.status_text.setText('Monitor idle')
+
+	def reset_arena(self):
+		"""bring ball back to center, remove winner sign"""
+		#self.plot_arena.clear()
+		self.plot_arena.removeItem(self.winner_text)
+		self.show_one_item = False
+
+		self.arena.reset()
+		self.curve_arena.setData([0], [0])
+
+	def reset_signal(self):
+		""" empty list of signal values"""
+		for curve in self.curves + self.curves_fft:
+			curve.setData([], [])
+		for decimator in self.decimators + self.decimators_fft:
+			decimator.reset()
+		self.time_range.reset()
+		self.plot.replot()
+
+	def on_start(self):
+		""" Start the monitor: the engine and the update timer
+		"""
+		if self.engine.running:
+			return
+
+		if self.show_one_item is True:
+			self.reset_arena()
+			self.reset_signal()
+
+		for error in self.engine.start():
+			QMessageBox.critical(self, 'Acquisition error', error)
+
+		self.monitor_active = True
+		self.set_actions_enable_state()
+
+		self.timer_plot = QTimer()
+		self.connect(self.timer_plot, SIGNAL('timeout()'), self.on_timer_plot)
+		## poll at twice the fastest pane rate, so frames are at
+		## most half a period late
+		self.snapshot = None
+		self.scheduler.reset()
+		self.timer_plot.start(1000.0 / (2*max(pane_rates.values()))) #ms
+
+		self.status_text.setText('Monitor running')
+
+	def on_timer_plot(self):
+		""" Executed periodically when the plot update timer
+			is fired. Renders the most recent snapshot of the
+			processing worker.
+		"""
+		snapshots = self.engine.snapshots
+		if snapshots is None:
+			return
+		if snapshots.has_new_data:
+			version = snapshots.version
+			self.snapshot = snapshots.read_data()
+		else:
+			version = self.scheduler.version
+		panes = self.scheduler.due(version)
+		if not panes or self.snapshot is None:
+			return
+		with self.set_data_timer.time():
+			self.update_monitor(self.snapshot, panes)
+		self.scheduler.drawn(panes)
+		self.frame_counter.add()
+		## the plots are repainted by the event loop, a zero
+		## timeout fires once it has processed the repaints
+		self.tpaint = monotonic()
+		QTimer.singleShot(0, self.on_painted)
+
+	def on_painted(self):
+		self.paint_timer.record(monotonic() - self.tpaint)
+
+	def on_stats(self):
+		if self.stats_action.isChecked():
+			self.on_timer_stats()
+			self.stats_window.show()
+			self.stats_timer.start(1000)
+		else:
+			self.stats_window.hide()
+			self.stats_timer.stop()
+
+	def on_timer_stats(self):
+		self.stats_text.setPlainText(metrics.report())
+
+	def on_arena(self):
+		self.arena.start()
+		self.curve_arena.setData([0], [0])
+		print('Game is starting.')
+
+	def tile_windows(self):
+		self.mdi.tileSubWindows()
+
+	def on_band_power_backend(self):
+		if self.recursive_action.isChecked():
+			self.band_power_backend = 'recursive'
+		else:
+			self.band_power_backend = 'fft'
+		self.engine.set_band_power_backend(self.band_power_backend)
+
+	def update_monitor(self, snapshot, panes=('signal', 'spectrum', 'arena')):
+		""" Updates the given panes of the monitor window with a
+			snapshot published by the processing worker.
+		"""
+		players = snapshot['players']
+
+		if 'signal' in panes:
+			xdata = players[0]['times']
+			width = self.plot.width()
+			visible = None
+			if len(xdata):
+				visible = (max(0,xdata[-1]-time_axis_range), max(time_axis_range, xdata[-1]))
+				self.time_range.set_range(self.plot, visible[0], visible[1], width)
+			for player, curve, decimator in zip(players, self.curves, self.decimators):
+				if len(player['times']):
+					data = decimator.update(player['times'], player['signal'], visible, width)
+					if data is not None:
+						curve.setData(data[0], data[1], _CallSync='off')
+
+		if 'spectrum' in panes:
+			## the spectrum plot may have been zoomed by the user
+			visible_fft = self.plot_fft.getViewBox().viewRange()[0]
+			width_fft = self.plot_fft.width()
+			for player, curve_fft, decimator_fft in zip(players, self.curves_fft, self.decimators_fft):
+				if player['ready']:
+					data = decimator_fft.update(player['freq'], player['spectrum'], visible_fft, width_fft)
+					if data is not None:
+						curve_fft.setData(data[0], data[1], _CallSync='off')
+
+		if self.monitor_active:
+			self.status_text.setText('Monitor running: ' + ' | '.join(
+				'%s, %d padded, %d dropped' % (player['status'], player['padded'], player['dropped'])
+				for player in players) + ' | skew %.0f ms | ' % (snapshot['skew']*1e3)
+				+ self.scheduler.status())
+
+		if 'arena' not in panes:
+			return
+		if snapshot['playing'] or snapshot['winner'] is not None:
+			self.curve_arena.setData([snapshot['ball'][0]], [snapshot['ball'][1]], _CallSync='off')
+
+		if snapshot['winner'] is not None and self.show_one_item is False:
+			winners = [self.players[i] for i in snapshot['winners']]
+			winner_color = winners[0]['color']
+			self.winner_text = pg.TextItem(html=self.text_html.format(
+				' & '.join(player['name'] for player in winners)), anchor=(0.5,2.3),\
+			border=QColor(winner_color), fill=(201, 165, 255, 100))
+
+			self.plot_arena.addItem(self.winner_text)
+			self.show_one_item = True
+			self.on_stop()
+			if self.on_winner is not None:
+				self.on_winner(winners)
+
+	# The following two methods are utilities for simpler creation
+	# and assignment of actions
+	#
+	def add_actions(self, target, actions):
+		for action in actions:
+			if action is None:
+				target.addSeparator()
+			else:
+				target.addAction(action)
+
+	def create_action(  self, text, slot=None, shortcut=None,
+						icon=None, tip=None, checkable=False,
+						signal="triggered()"):
+		action = QAction(text, self)
+		if icon is not None:
+			action.setIcon(QIcon(":/%s.png" % icon))
+		if shortcut is not None:
+			action.setShortcut(shortcut)
+		if tip is not None:
+			action.setToolTip(tip)
+			action.setStatusTip(tip)
+		if slot is not None:
+			self.connect(action, SIGNAL(signal), slot)
+		if checkable:
+			action.setCheckable(True)
+		return action
+
+
+def main(players=None, **kwargs):
+	app = QApplication(sys.argv)
+	if players is None:
+		players = make_players(sys.argv[1:] or ['/dev/ttyACM0', '/dev/ttyACM1'])
+	form = PlottingDataMonitor(players, **kwargs)
+	form.show()
+	app.exec_()
+
+
+if __name__ == "__main__":
+	main()
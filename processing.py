@@ -0,0 +1,470 @@
+import threading
+import time
+
+import numpy as np
+
+from libs.utils import get_all_from_queue, get_item_from_queue, metrics
+from libs.timebase import monotonic
+from libs.ingest import SampleIngestor
+from libs.dsp import StreamingFilter, SpectralEstimator, RecursiveBandPower, UniformResampler
+from libs.chunkqueue import ChunkQueue
+from livedatafeed import LiveDataFeed
+from acquisition import SharedSampleReader
+
+
+class PlayersPipeline(object):
+	""" Processing chain of all headsets of a game: decoding of the
+		serial chunks, resampling onto a common uniform grid, band-
+		pass filtering, spectra and band power.
+
+		After resampling the signals of all players are stacked
+		into arrays with one row per player, so that filtering,
+		spectra and band powers take one numpy call per step
+		whatever the number of players. As all rows share the
+		grid, the band powers the arena compares are those of the
+		same interval for every player, whatever the transport
+		delays of the headsets.
+
+		Chunks of player i are added with add_chunks(i, qdata) as
+		they arrive, or joined into one string with add_data(i,
+		data, timestamp), samples that were already decoded (e.g. by
+		an AcquisitionProcess) with add_samples(i, times, values).
+		process() then filters everything up to the newest common
+		sample and leaves the mean recursive band power of the new
+		samples in block_power (over block_duration seconds),
+		update_spectrum() is called at the (lower) plot rate.
+
+		offsets:
+			Subtracted from the signals before filtering, a scalar
+			or one value per player.
+
+		accumulate:
+			If True, the displayed spectra and their band powers
+			are the normalized running sums of all spectra so far
+			instead of the spectra of the current window.
+
+		max_lag:
+			Maximum skew between the players in s: how long the
+			grid waits for a lagging player before it moves on,
+			holding the player's last value, see UniformResampler.
+
+		The ball may only move on data every player delivered:
+		take_fresh() tells whether the grid advanced since its last
+		call over samples of every player, without holding the
+		value of a player that fell behind.
+
+		The stages are timed in the metrics registry: dsp.resample,
+		dsp.filter, dsp.band_power (recursive) and dsp.fft
+		(spectra and their band power). The alignment is recorded
+		as align.delay (how far the new grid points trail the
+		newest sample), align.skew (spread of the newest samples of
+		the players) and the counters align.padded and
+		align.dropped (held grid points and samples that came too
+		late, over all players).
+	"""
+	def __init__(self, nplayers, sample_rate, ingest_mode, fs, nmax, b, a, x_low, x_high,
+			offsets=0., dc_in_norm=False, accumulate=False, max_lag=0.5):
+		self.nplayers = nplayers
+		self.nmax = nmax
+		self.offsets = np.zeros((nplayers, 1)) + np.reshape(offsets, (-1, 1))
+		self.accumulate = accumulate
+		self.ingestors = [SampleIngestor(sample_rate, ingest_mode) for i in range(nplayers)]
+		self.status_sources = list(self.ingestors)
+		self.resampler = UniformResampler(fs, nplayers, max_lag=max_lag)
+		self.bandpass = StreamingFilter(b, a, nmax, channels=nplayers)
+		self.spectrum = SpectralEstimator(nmax, 1./fs, x_low, x_high,
+			dc_in_norm=dc_in_norm, channels=nplayers)
+		self.recursive_power = RecursiveBandPower(fs, x_low, x_high, channels=nplayers)
+		self.timers = dict((stage, metrics.histogram('dsp.' + stage))
+			for stage in ('resample', 'filter', 'band_power', 'fft'))
+		self.align_delay = metrics.histogram('align.delay')
+		self.align_skew = metrics.gauge('align.skew')
+		self.align_padded = metrics.counter('align.padded')
+		self.align_dropped = metrics.counter('align.dropped')
+		self.reset()
+
+	def reset(self):
+		self.resampler.reset()
+		self.padded = 0
+		self.dropped = 0
+		self.bandpass.reset()
+		self.recursive_power.reset()
+		self.fft_norm = np.zeros((self.nplayers, self.spectrum.nfreq))
+		self.power_fft = np.zeros(self.nplayers)
+		self.recursive_integral = np.zeros(self.nplayers)
+		self.block_power = np.zeros(self.nplayers)
+		self.block_duration = 0.
+		self.stepped = (None, np.zeros(self.nplayers, dtype=int))
+		self.ready = False
+
+	def add_chunks(self, player, qdata):
+		""" Decode a list of (data, timestamp) chunks of a player """
+		output = self.ingestors[player].ingest(qdata)
+		if output is not None:
+			self.resampler.add(player, *output)
+
+	def add_data(self, player, data, timestamp, lost_bytes=0):
+		""" Decode the joined data of chunks of a player, the last
+			of which arrived at 'timestamp', after lost_bytes were
+			discarded by the queue
+		"""
+		output = self.ingestors[player].ingest_data(data, timestamp, lost_bytes)
+		if output is not None:
+			self.resampler.add(player, *output)
+
+	def add_samples(self, player, times, values):
+		self.resampler.add(player, times, values)
+
+	def process(self, until=None):
+		""" Resample and filter the samples added so far, up to
+			the time 'until' if given. Returns True if new samples
+			were added to the window.
+		"""
+		with self.timers['resample'].time():
+			times, values = self.resampler.process(until)
+		self.record_alignment()
+		if len(times)==0:
+			return False
+		with self.timers['filter'].time():
+			self.bandpass.process(times, values - self.offsets)
+		with self.timers['band_power'].time():
+			self.recursive_power.set_rate(self.resampler.effective_rate)
+			power = self.recursive_power.update(values)
+			self.block_duration = len(times)*self.resampler.d
+			self.block_power = np.mean(power, axis=-1)
+			self.recursive_integral += self.block_power*self.block_duration
+		return True
+
+	def take_fresh(self):
+		""" True if new grid points were made since the last call,
+			none of them holding the value of a player
+		"""
+		t_next, padded = self.stepped
+		if self.resampler.t_next is None or self.resampler.t_next==t_next:
+			return False
+		self.stepped = (self.resampler.t_next, self.resampler.padded.copy())
+		return not np.any(self.resampler.padded>padded)
+
+	def record_alignment(self):
+		padded, dropped = int(np.sum(self.resampler.padded)), int(np.sum(self.resampler.dropped))
+		if padded>self.padded:
+			self.align_padded.add(padded - self.padded)
+			self.padded = padded
+		if dropped>self.dropped:
+			self.align_dropped.add(dropped - self.dropped)
+			self.dropped = dropped
+		if np.any(self.resampler.count>0):
+			self.align_delay.record(self.resampler.delay)
+			self.align_skew.set(float(self.resampler.skew))
+
+	def update_spectrum(self):
+		""" Spectra of the current window, once it is filled """
+		self.ready = len(self.bandpass.output)>=self.nmax
+		if not self.ready:
+			return
+		with self.timers['fft'].time():
+			self.spectrum.set_spacing(self.resampler.d)
+			fft, power = self.spectrum.update(self.bandpass.output.latest()[1])
+			if self.accumulate:
+				self.fft_norm += fft		#single items not well weighted
+				self.fft_norm /= np.sum(self.fft_norm, axis=-1, keepdims=True)
+				self.power_fft[:] = np.sum(self.fft_norm[:, self.spectrum.band], axis=-1)
+			else:
+				self.fft_norm[:] = fft
+				self.power_fft[:] = power
+
+	def pop_recursive_power(self, interval):
+		""" Mean recursive band power of every player over the last
+			'interval' seconds, integrated over all samples since
+			the last call.
+		"""
+		power = self.recursive_integral/interval
+		self.recursive_integral = np.zeros(self.nplayers)
+		return power
+
+	def snapshot(self):
+		""" Copies of the data to plot, one dict per player """
+		times, signals = self.bandpass.output.latest()
+		times, signals, spectra = times.copy(), signals.copy(), self.fft_norm.copy()
+		return [dict(times=times, signal=signals[i],
+					freq=self.spectrum.freq, spectrum=spectra[i],
+					ready=self.ready, power=self.power_fft[i],
+					padded=int(self.resampler.padded[i]), dropped=int(self.resampler.dropped[i]),
+					status=self.status_sources[i].status())
+				for i in range(self.nplayers)]
+
+
+class Arena(object):
+	""" Ball physics and win detection of the game.
+
+		sides:
+			One entry per player, the goal the player plays
+			towards: 1 (right) or -1 (left). Players on the same
+			side form a team whose band powers are averaged, so
+			teams of different size play on equal terms. The ball
+			moves along x by the difference of the team powers
+			times the tuning factor; a team wins when the ball
+			leaves the field on its side. Without a team on a
+			side, the ball stops at that goal line.
+
+		damping:
+			Fraction by which the y coordinate is pulled back when
+			the ball gets close to the side lines.
+
+		update(powers, recursive, weight) makes one step of the
+		ball; 'weight' is the length of the step in update
+		intervals, so that steps of the recursive band power, made
+		for every processed block of samples, move the ball as fast
+		as the steps of the fft backend at the update rate.
+
+		winner/winners:
+			Side of the winning team and the indices of its
+			players, None and [] while nobody has won.
+	"""
+	def __init__(self, sides, tuning_factor=0.1, tuning_factor_recursive=0.005,
+			damping=0.3):
+		self.sides = np.sign(sides)
+		self.weights = np.array([side/float(np.sum(self.sides==side)) for side in self.sides])
+		self.tuning_factor = tuning_factor
+		## the recursive estimate measures relative power, at 10 kHz
+		## about 20 times the relative magnitude of the fft backend
+		self.tuning_factor_recursive = tuning_factor_recursive
+		self.damping = damping
+		self.playing = False
+		self.reset()
+
+	def reset(self):
+		self.ball_coordx = 0.
+		self.ball_coordy = 0.
+		self.position = (0., 0.)
+		self.winner = None
+		self.winners = []
+
+	def start(self):
+		self.reset()
+		self.playing = True
+
+	def update(self, powers, recursive=False, weight=1.):
+		""" Move the ball by one step given the band power of each
+			player. Returns the side of the winning team or None.
+		"""
+		if not self.playing:
+			return None
+		factor = self.tuning_factor_recursive if recursive else self.tuning_factor
+		self.ball_coordx += np.dot(self.weights, powers)*factor*weight
+		self.ball_coordy += np.random.normal(scale=0.05*np.sqrt(weight))
+		self.position = (np.sign(self.ball_coordx)*min(1, abs(self.ball_coordx)), self.ball_coordy)
+
+		if abs(self.ball_coordy)>(0.7*(1.1-abs(self.ball_coordx))):
+			self.ball_coordy = self.ball_coordy*(1. - self.damping)**weight
+		if abs(self.ball_coordx)>1:
+			side = int(np.sign(self.ball_coordx))
+			if np.any(self.sides==side):
+				self.winner = side
+				self.winners = [int(i) for i in np.flatnonzero(self.sides==side)]
+				self.playing = False
+			else:
+				self.ball_coordx = side
+		return self.winner
+
+
+class ProcessingWorker(threading.Thread):
+	""" A thread consuming the data queues of the ComMonitorThreads,
+		or the shared buffers of AcquisitionProcesses, of all
+		players.
+
+		Every chunk is decoded and filtered as soon as it arrives.
+		At 'update_freq' Hz the spectra and the ball are updated and
+		a snapshot with copies of everything to plot is published
+		in 'snapshots', a LiveDataFeed: the GUI reads the most
+		recent snapshot whenever it renders, older ones are simply
+		replaced.
+
+		data_qs:
+			One data source per player, either the data queue of a
+			ComMonitorThread or a SharedSampleReader, which then
+			also provides the status of the player. A ChunkQueue is
+			emptied in one go with drain(), other queues chunk by
+			chunk.
+
+		pipeline:
+			The PlayersPipeline processing all players.
+
+		band_power_backend:
+			'fft' or 'recursive', may be changed while running.
+			With 'fft' the ball moves at every update, with
+			'recursive' after every processed block of samples,
+			driven by the recursive band power of that block; the
+			snapshots then show its mean over the update interval.
+			Either way only on new data of every player: the ball
+			stands still while a headset is stalled or unplugged,
+			or a replay has ended.
+
+		recorders:
+			Optional SessionWriter (or None) per player, recording
+			the chunks of a data queue or the samples of a shared
+			buffer as they are taken. They are closed when the
+			worker stops.
+
+		subscribers:
+			Callables receiving every snapshot in the worker thread,
+			for consumers that must not miss an update (e.g. the
+			stream output of the headless engine).
+
+		queue_wait:
+			If True, the age of the oldest chunk of every batch is
+			recorded as queue.wait. Needs chunk timestamps of
+			libs.timebase.monotonic(), which replayed sessions do
+			not have.
+
+		clock:
+			'wall' updates every update interval of real time,
+			'data' every update interval of the time of the samples,
+			for replays: however fast the data comes in, every
+			update then covers the same span of the match.
+
+		Recorded in the metrics registry: queue.wait, queue.depth (chunks
+		taken over all players in the last pass), game.physics and
+		worker.update (a whole update including the subscribers).
+	"""
+	def __init__(self, data_qs, pipeline, arena, update_freq=10.,
+			band_power_backend='fft', timeout=0.01, recorders=None, queue_wait=True,
+			clock='wall'):
+		if clock not in ('wall', 'data'):
+			raise ValueError('unknown clock %r' % clock)
+		threading.Thread.__init__(self)
+		self.daemon = True
+		self.data_qs = data_qs
+		self.pipeline = pipeline
+		self.arena = arena
+		self.update_interval = 1./update_freq
+		self.band_power_backend = band_power_backend
+		self.timeout = timeout
+		self.clock = clock
+		self.next_tick = None
+		self.recorders = recorders or [None]*len(data_qs)
+		self.snapshots = LiveDataFeed()
+		self.subscribers = []
+		self.queue_wait = metrics.histogram('queue.wait') if queue_wait else None
+		self.queue_depth = metrics.gauge('queue.depth')
+		self.physics_timer = metrics.histogram('game.physics')
+		self.update_timer = metrics.histogram('worker.update')
+		for i, source in enumerate(data_qs):
+			if isinstance(source, SharedSampleReader):
+				pipeline.status_sources[i] = source
+
+		self.alive = threading.Event()
+		self.alive.set()
+
+	def run(self):
+		next_update = time.time()
+		while self.alive.isSet():
+			## wait for data of the first player, then take
+			## whatever the others sent in the meantime; shared
+			## buffers can not be waited on and are polled
+			first = None
+			if isinstance(self.data_qs[0], SharedSampleReader):
+				time.sleep(self.timeout)
+			elif not isinstance(self.data_qs[0], ChunkQueue):
+				first = get_item_from_queue(self.data_qs[0], self.timeout)
+			## the chunks taken are the backlog found, counted
+			## without locking the queues once more
+			depth = 0
+			for i, (source, recorder) in enumerate(zip(self.data_qs, self.recorders)):
+				if isinstance(source, SharedSampleReader):
+					times, values = source.read()
+					if recorder is not None:
+						recorder.write_samples(times, values)
+					self.pipeline.add_samples(i, times, values)
+					continue
+				if isinstance(source, ChunkQueue):
+					batch = source.drain(self.timeout if i==0 else 0.)
+					if batch is None:
+						self.pipeline.add_data(i, b'', None)
+						continue
+					data, ends, timestamps, dropped = batch
+					depth += len(ends)
+					if self.queue_wait is not None:
+						self.queue_wait.record(monotonic() - timestamps[0])
+					if recorder is not None:
+						recorder.write_batch(data, ends, timestamps)
+					self.pipeline.add_data(i, data, timestamps[-1], dropped)
+					continue
+				qdata = list(get_all_from_queue(source))
+				if i==0 and first is not None:
+					qdata.insert(0, first)
+				depth += len(qdata)
+				if qdata and self.queue_wait is not None:
+					self.queue_wait.record(monotonic() - qdata[0][1])
+				if recorder is not None:
+					recorder.write_chunks(qdata)
+				self.pipeline.add_chunks(i, qdata)
+			self.queue_depth.set(depth)
+			if self.clock=='data':
+				self.process_data_time()
+				continue
+			self.process()
+
+			now = time.time()
+			if now>=next_update:
+				next_update = max(next_update + self.update_interval, now)
+				with self.update_timer.time():
+					self.update()
+
+		for recorder in self.recorders:
+			if recorder is not None:
+				recorder.close()
+
+	def process(self, until=None):
+		""" Process the samples taken, up to the time 'until' if
+			given, and move the ball with the recursive backend
+		"""
+		if (self.pipeline.process(until) and self.band_power_backend=='recursive'
+				and self.pipeline.ready and self.pipeline.take_fresh()):
+			with self.physics_timer.time():
+				self.arena.update(self.pipeline.block_power, True,
+					self.pipeline.block_duration/self.update_interval)
+
+	def process_data_time(self):
+		""" Process the samples taken in steps of the update
+			interval of data time, updating after each complete step
+		"""
+		resampler = self.pipeline.resampler
+		while True:
+			if self.next_tick is None:
+				if not np.any(resampler.count>0):
+					return
+				self.next_tick = np.nanmin(resampler.t_first) + self.update_interval
+			self.process(self.next_tick)
+			## the grid has not reached the tick yet (up to rounding)
+			if resampler.t_next is None or resampler.t_next<self.next_tick - resampler.d/2:
+				return
+			self.next_tick += self.update_interval
+			with self.update_timer.time():
+				self.update()
+
+	def update(self):
+		self.pipeline.update_spectrum()
+
+		powers = self.pipeline.pop_recursive_power(self.update_interval)
+		if self.band_power_backend!='recursive':
+			powers = self.pipeline.power_fft
+			if self.pipeline.ready and self.pipeline.take_fresh():
+				with self.physics_timer.time():
+					self.arena.update(powers)
+
+		snapshot = dict(
+			players=self.pipeline.snapshot(),
+			powers=np.array(powers),
+			playing=self.arena.playing,
+			ball=self.arena.position,
+			skew=float(self.pipeline.resampler.skew),
+			winner=self.arena.winner,
+			winners=list(self.arena.winners))
+		self.snapshots.add_data(snapshot)
+		for subscriber in self.subscribers:
+			subscriber(snapshot)
+
+	def join(self, timeout=None):
+		self.alive.clear()
+		threading.Thread.join(self, timeout)
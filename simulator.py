@@ -0,0 +1,298 @@
+"""
+EEG headset simulator: pseudo terminals that behave like the
+Arduino of a headset, for running the monitors without hardware.
+
+	python simulator.py [options]
+
+prints the port of every simulated device, e.g. to start a game of
+virtual headsets:
+
+	python simulator.py -n 2 &
+	python plotting_data_monitor.py /dev/pts/3 /dev/pts/4
+
+A device waits for the 'conf s:<rate>;c:<channels>;' command sent by
+ComMonitorThread, then streams 2-byte frames (upper 7 bits with the
+high bit set, then the lower 7 bits) of synthetic EEG at the
+configured rate, channels interleaved. Run with --help for the
+signal and link options.
+"""
+from __future__ import print_function, division
+import argparse
+import errno
+import fcntl
+import os
+import re
+import select
+import sys
+import threading
+import time
+import tty
+
+import numpy as np
+
+from libs.decode import encode_samples
+
+
+class SyntheticEEG(object):
+	""" Synthetic single channel EEG in ADC units.
+
+		White noise around 'offset', alpha bursts (a sine at
+		alpha_freq under a Hann envelope of burst_duration seconds)
+		and artifacts (half sine deflections of artifact_duration
+		seconds and random sign, like eye blinks). Bursts and
+		artifacts start at random, on average burst_rate and
+		artifact_rate times per second, and may span several calls
+		of generate().
+
+		Samples are clipped to the 10 bit range of the ADC.
+	"""
+	def __init__(self, sample_rate=10000., offset=512., noise=20., alpha_amplitude=60.,
+			alpha_freq=10., burst_rate=0.5, burst_duration=1., artifact_rate=0.1,
+			artifact_amplitude=300., artifact_duration=0.3, seed=None):
+		self.sample_rate = float(sample_rate)
+		self.offset = offset
+		self.noise = noise
+		self.alpha_amplitude = alpha_amplitude
+		self.alpha_freq = alpha_freq
+		self.burst_rate = burst_rate
+		self.burst_duration = burst_duration
+		self.artifact_rate = artifact_rate
+		self.artifact_amplitude = artifact_amplitude
+		self.artifact_duration = artifact_duration
+		self.rng = np.random.RandomState(seed)
+		self.t = 0.
+		## (start, duration, amplitude, kind) of the bursts and
+		## artifacts that have not ended yet
+		self.events = []
+
+	def set_rate(self, sample_rate):
+		self.sample_rate = float(sample_rate)
+
+	def _start_events(self, t_stop):
+		for rate, duration, amplitude, kind in (
+				(self.burst_rate, self.burst_duration, self.alpha_amplitude, 'alpha'),
+				(self.artifact_rate, self.artifact_duration, self.artifact_amplitude, 'artifact')):
+			n = self.rng.poisson(rate*(t_stop - self.t))
+			for start in self.rng.uniform(self.t, t_stop, n):
+				if kind=='artifact':
+					amplitude = amplitude*self.rng.choice([-1, 1])
+				self.events.append((start, duration, amplitude, kind))
+
+	def generate(self, n):
+		""" The next n samples as int array """
+		t = self.t + np.arange(n)/self.sample_rate
+		t_stop = self.t + n/self.sample_rate
+		self._start_events(t_stop)
+		signal = self.offset + self.noise*self.rng.normal(size=n)
+		for start, duration, amplitude, kind in self.events:
+			inside = (t>=start) & (t<start + duration)
+			phase = (t[inside] - start)/duration
+			if kind=='alpha':
+				envelope = 0.5 - 0.5*np.cos(2*np.pi*phase)
+				signal[inside] += amplitude*envelope*np.sin(2*np.pi*self.alpha_freq*t[inside])
+			else:
+				signal[inside] += amplitude*np.sin(np.pi*phase)
+		self.events = [event for event in self.events if event[0] + event[1]>t_stop]
+		self.t = t_stop
+		return np.clip(np.round(signal), 0, 1023).astype(int)
+
+
+class DeviceSimulator(object):
+	""" One simulated headset on a pseudo terminal.
+
+		port:
+			Name of the slave side of the pty, to be opened like a
+			serial port.
+
+		wait_conf:
+			If True, nothing is sent before the first conf command,
+			like the device firmware. Every conf command restarts
+			the stream at the requested rate and channel count.
+
+		drop_rate:
+			Probability of every byte to be lost on the link, which
+			makes the decoder lose sync.
+
+		Further keyword arguments configure the SyntheticEEG of
+		every channel.
+
+		samples/bytes_written/bytes_dropped/overruns/commands:
+			Counters of samples generated per channel, bytes
+			written to and dropped on the link, bytes lost because
+			the reader did not keep up (the pty buffer was full),
+			and conf commands received.
+
+		step() sends the samples due since the stream started,
+		SimulatorThread calls it for any number of devices.
+	"""
+	def __init__(self, sample_rate=10000., channels=1, wait_conf=True, drop_rate=0.,
+			seed=None, **eeg):
+		self.master, self.slave = os.openpty()
+		tty.setraw(self.slave)
+		flags = fcntl.fcntl(self.master, fcntl.F_GETFL)
+		fcntl.fcntl(self.master, fcntl.F_SETFL, flags | os.O_NONBLOCK)
+		self.port = os.ttyname(self.slave)
+
+		self.drop_rate = drop_rate
+		self.rng = np.random.RandomState(seed)
+		self.eeg_args = eeg
+		self.seed = seed
+		self.configure(sample_rate, channels)
+		self.streaming = not wait_conf
+
+		self.samples = 0
+		self.bytes_written = 0
+		self.bytes_dropped = 0
+		self.overruns = 0
+		self.commands = 0
+		self._input = b''
+
+	def configure(self, sample_rate, channels):
+		self.sample_rate = float(sample_rate)
+		self.channels = channels
+		self.generators = [SyntheticEEG(sample_rate, seed=None if self.seed is None else self.seed + i,
+				**self.eeg_args)
+			for i in range(channels)]
+		self.tstart = None
+		self.sent = 0
+		self.streaming = True
+
+	def fileno(self):
+		return self.master
+
+	def handle_input(self):
+		""" Read and execute the commands written to the port """
+		try:
+			self._input += os.read(self.master, 1024)
+		except OSError as e:
+			if e.errno not in (errno.EAGAIN, errno.EIO):
+				raise
+			return
+		lines = self._input.split(b'\n')
+		self._input = lines.pop()
+		for line in lines:
+			match = re.match(br'\s*conf\s+s:(\d+);c:(\d+);', line)
+			if match:
+				self.commands += 1
+				self.configure(int(match.group(1)), int(match.group(2)))
+
+	def step(self, now=None):
+		""" Send the samples due at time 'now' """
+		if not self.streaming:
+			return
+		now = time.time() if now is None else now
+		if self.tstart is None:
+			self.tstart = now
+		n = int((now - self.tstart)*self.sample_rate) - self.sent
+		if n<=0:
+			return
+		self.sent += n
+		self.samples += n
+		samples = np.empty((n, self.channels), dtype=int)
+		for i, generator in enumerate(self.generators):
+			samples[:, i] = generator.generate(n)
+		data = encode_samples(samples.ravel())
+		if self.drop_rate>0:
+			data = np.frombuffer(data, dtype=np.uint8)
+			keep = self.rng.random_sample(len(data))>=self.drop_rate
+			self.bytes_dropped += len(data) - np.count_nonzero(keep)
+			data = data[keep].tobytes()
+		while data:
+			try:
+				written = os.write(self.master, data)
+			except OSError as e:
+				if e.errno!=errno.EAGAIN:
+					raise
+				self.overruns += len(data)
+				break
+			self.bytes_written += written
+			data = data[written:]
+
+	def status(self):
+		return '%s: %.0f Hz x %d, %d samples, %d bytes, %d dropped, %d overrun' % (
+			self.port, self.sample_rate, self.channels, self.samples,
+			self.bytes_written, self.bytes_dropped, self.overruns)
+
+	def close(self):
+		os.close(self.master)
+		os.close(self.slave)
+
+
+class SimulatorThread(threading.Thread):
+	""" Runs any number of DeviceSimulators: waits up to 'interval'
+		seconds for commands on their ports, then sends the samples
+		due on every device.
+	"""
+	def __init__(self, simulators, interval=0.002):
+		threading.Thread.__init__(self)
+		self.daemon = True
+		self.simulators = simulators
+		self.interval = interval
+		self.alive = threading.Event()
+		self.alive.set()
+
+	def run(self):
+		while self.alive.isSet():
+			readable = select.select(self.simulators, [], [], self.interval)[0]
+			for simulator in readable:
+				simulator.handle_input()
+			now = time.time()
+			for simulator in self.simulators:
+				simulator.step(now)
+		for simulator in self.simulators:
+			simulator.close()
+
+	def join(self, timeout=None):
+		self.alive.clear()
+		threading.Thread.join(self, timeout)
+
+
+def start_simulators(n, interval=0.002, **kwargs):
+	""" Start n DeviceSimulators in one SimulatorThread. Returns the
+		thread and the simulators; joining the thread closes them.
+	"""
+	seed = kwargs.pop('seed', None)
+	simulators = [DeviceSimulator(seed=None if seed is None else seed + 100*i, **kwargs)
+		for i in range(n)]
+	thread = SimulatorThread(simulators, interval)
+	thread.start()
+	return thread, simulators
+
+
+def main(argv):
+	parser = argparse.ArgumentParser(description='Simulated EEG headsets on pseudo terminals')
+	parser.add_argument('-n', type=int, default=1, help='number of devices')
+	parser.add_argument('--rate', type=float, default=10000.,
+		help='sample rate in Hz until a conf command sets it')
+	parser.add_argument('--channels', type=int, default=1)
+	parser.add_argument('--no-wait-conf', action='store_true',
+		help='stream right away instead of waiting for the conf command')
+	parser.add_argument('--noise', type=float, default=20.)
+	parser.add_argument('--alpha', type=float, default=60., help='alpha burst amplitude')
+	parser.add_argument('--burst-rate', type=float, default=0.5, help='alpha bursts per s')
+	parser.add_argument('--artifact-rate', type=float, default=0.1, help='artifacts per s')
+	parser.add_argument('--drop-rate', type=float, default=0., help='fraction of bytes lost')
+	parser.add_argument('--seed', type=int)
+	parser.add_argument('--duration', type=float, help='stop after this many seconds')
+	args = parser.parse_args(argv)
+
+	thread, simulators = start_simulators(args.n, sample_rate=args.rate,
+		channels=args.channels, wait_conf=not args.no_wait_conf, drop_rate=args.drop_rate,
+		seed=args.seed, noise=args.noise, alpha_amplitude=args.alpha,
+		burst_rate=args.burst_rate, artifact_rate=args.artifact_rate)
+	for simulator in simulators:
+		print(simulator.port)
+	sys.stdout.flush()
+	tstart = time.time()
+	try:
+		while args.duration is None or time.time() - tstart<args.duration:
+			time.sleep(0.1)
+	except KeyboardInterrupt:
+		pass
+	for simulator in simulators:
+		print(simulator.status(), file=sys.stderr)
+	thread.join(1.)
+
+
+if __name__ == "__main__":
+	main(sys.argv[1:])